@@ -36,6 +36,21 @@ document = TeXSevenDocument(vim.current.buffer)
 EOF
 endfunction
 
+" Looks for changed files of the project every few seconds, so that what TeX-7
+" derived from them (master file, BibTeX databases, labels, pictures etc.) is
+" brought up to date when needed.
+function tex_seven#StartChecking()
+  if exists('s:check_timer') || !has('timers') || b:tex_seven_config.check_interval <= 0
+    return
+  endif
+  let s:check_timer = timer_start(1000 * b:tex_seven_config.check_interval,
+        \ function('s:Check'), {'repeat': -1})
+endfunction
+
+function s:Check(timer)
+  python3 omni.update()
+endfunction
+
 " Legacy; currently unused. Maybe useful for SyncTeX?
 function tex_seven#GetMaster()
 python3 << EOF
@@ -87,6 +102,80 @@ except TeXSevenError as e:
 EOF
 endfunction
 
+"******************************************************************************
+" Indexing worker (see ftplugin/tex_seven/tex_seven_worker.py)
+"******************************************************************************
+
+let s:worker_script = expand('<sfile>:p:h:h').'/ftplugin/tex_seven/tex_seven_worker.py'
+
+" The worker listens on a Unix socket, in a folder only the user can reach.
+function s:WorkerAddress()
+  if !empty($XDG_RUNTIME_DIR)
+    return $XDG_RUNTIME_DIR.'/tex_seven-worker.sock'
+  endif
+  let dir = expand('~/.cache/tex_seven')
+  if !isdirectory(dir)
+    call mkdir(dir, 'p', 0700)
+  endif
+  return dir.'/worker.sock'
+endfunction
+
+" Connects to the indexing worker, starting the worker if needed. Returns 1
+" if s:channel is open. If the worker cannot be started, it is not tried
+" again, so that completion does not wait for it every time.
+function s:WorkerConnect()
+  if exists('s:channel') && ch_status(s:channel) == 'open'
+    return 1
+  endif
+  if get(s:, 'worker_failed', 0)
+    return 0
+  endif
+
+  let address = 'unix:'.s:WorkerAddress()
+  let s:channel = ch_open(address, {'mode': 'json', 'waittime': 0})
+  if ch_status(s:channel) != 'open'
+    " The worker is not stopped when Vim exits, so that other Vim instances
+    " may keep using it; it exits by itself when nobody is connected.
+    call job_start([b:tex_seven_config.worker, s:worker_script,
+          \ s:WorkerAddress()],
+          \ {'stoponexit': '', 'in_io': 'null', 'out_io': 'null', 'err_io': 'null'})
+    let s:channel = ch_open(address, {'mode': 'json', 'waittime': 1000})
+  endif
+
+  if ch_status(s:channel) != 'open'
+    let s:worker_failed = 1
+    echomsg "TeX-7: Cannot start the indexing worker; working inside Vim."
+    return 0
+  endif
+  return 1
+endfunction
+
+function s:WorkerReply(method, master, channel, result)
+python3 << EOF
+omni.worker_result(vim.eval('a:method'), vim.eval('a:master'), vim.eval('a:result'))
+EOF
+endfunction
+
+" Asks the worker for the result of `method' (e.g. 'labels') for the project
+" whose master file is `master'. The reply arrives asynchronously. Returns 1
+" if the request was sent.
+function tex_seven#WorkerRequest(method, master)
+  if !s:WorkerConnect()
+    return 0
+  endif
+  let args = empty(a:master) ? [a:method] : [a:method, a:master]
+  call ch_sendexpr(s:channel, args,
+        \ {'callback': function('s:WorkerReply', [a:method, a:master])})
+  return 1
+endfunction
+
+" Gets fresh results from the worker, e.g. after a file was written.
+function tex_seven#WorkerRefresh()
+  if !empty(b:tex_seven_config.worker)
+    python3 omni.worker_refresh(vim.current.buffer)
+  endif
+endfunction
+
 function tex_seven#ViewDocument()
   echo "Viewing the document...\r"
   python3 document.view(vim.current.buffer)
@@ -102,8 +191,10 @@ function tex_seven#OmniCompletion(findstart, base)
     let pos = py3eval('omni.findstart()')
     return pos
   else
-    let compl = py3eval('omni.completions()')
-    return compl
+    " Completions are cut to completion_limit: ask to be called again on
+    " every keystroke, so that Vim does not only filter the first ones.
+    let compl = py3eval('omni.completions(vim.eval("a:base"))')
+    return {'words': compl, 'refresh': 'always'}
   endif
 endfunction
 
@@ -118,7 +209,7 @@ function tex_seven#MathCompletion(findstart, base)
     endwhile
     return start
   else
-    let compl = py3eval('tex_seven_maths_cache')
+    let compl = py3eval('omni.math_completions()')
     call filter(compl, 'v:val.word =~ "^'.a:base.'"')
     "let res = []
     "for m in compl
@@ -143,7 +234,69 @@ endfunction
 function tex_seven#Incquery(cword)
 python3 << EOF
 try:
-  document.incquery(vim.eval('a:cword'), omni.incpaths)
+  document.incquery(vim.eval('a:cword'), omni.get_project_files(vim.current.buffer))
+except TeXSevenError as e:
+  echoerr(e)
+EOF
+return
+endfunction
+
+" Lists where the label or citekey under the cursor is defined and used.
+function tex_seven#References()
+python3 << EOF
+try:
+  document.references(vim.current.buffer, omni)
+except TeXSevenError as e:
+  echoerr(e)
+EOF
+return
+endfunction
+
+" Lists unused labels, undefined references and citations, and uncited
+" BibTeX entries.
+function tex_seven#CheckReferences()
+python3 << EOF
+try:
+  document.check_references(vim.current.buffer, omni)
+except TeXSevenError as e:
+  echoerr(e)
+EOF
+return
+endfunction
+
+" Shows the outline of the project in the location list.
+function tex_seven#Outline()
+python3 << EOF
+try:
+  document.outline(vim.current.buffer)
+except TeXSevenError as e:
+  echoerr(e)
+EOF
+return
+endfunction
+
+" Shows the word, equation, figure and citation counts of the project in the
+" location list.
+function tex_seven#Statistics()
+python3 << EOF
+try:
+  document.statistics(vim.current.buffer)
+except TeXSevenError as e:
+  echoerr(e)
+EOF
+return
+endfunction
+
+" Returns the number of words of the project, e.g. for 'statusline'.
+function tex_seven#WordCount()
+  return py3eval('document.word_count(vim.current.buffer)')
+endfunction
+
+" Jumps `count' headings forwards or, if negative, backwards in the project.
+function tex_seven#JumpSection(count)
+python3 << EOF
+try:
+  document.jump_section(vim.current.buffer, int(vim.eval('a:count')))
 except TeXSevenError as e:
   echoerr(e)
 EOF
@@ -196,7 +349,8 @@ endfunction
 
 function tex_seven#ChangeFontStyle(style)
   let str = 'di'
-  let is_math = py3eval("int(is_latex_math_environment(vim.current.window))")
+  let is_math = py3eval("int(is_latex_math_environment(vim.current.window, "
+        \ ."extra=omni.math_environments()))")
   let str .= is_math ? '\math'.a:style : '\text'.a:style
   let str .= "{}\<Left>\<C-R>\""
   return str
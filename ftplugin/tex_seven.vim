@@ -55,6 +55,20 @@ setlocal omnifunc=tex_seven#OmniCompletion
 setlocal completefunc=tex_seven#MathCompletion
 
 call tex_seven#AddBuffer()
+call tex_seven#WorkerRefresh()
+call tex_seven#StartChecking()
+
+" Completion matches are narrowed down while typing; start afresh next time.
+" After writing a file, look for whatever changed in the project. The word
+" count of the status line is only updated when the user stops typing.
+augroup tex_seven
+  autocmd! * <buffer>
+  autocmd InsertLeave <buffer> python3 omni.forget_completions()
+  autocmd CursorHold,CursorHoldI,InsertLeave,BufWritePost <buffer>
+        \ python3 document.count_words(vim.current.buffer)
+  autocmd BufWritePost <buffer> python3 omni.update()
+  autocmd BufWritePost <buffer> call tex_seven#WorkerRefresh()
+augroup END
 
 "***********************************************************************
 
@@ -79,6 +93,16 @@ noremap <buffer><silent> <LocalLeader>Q :copen<CR>
 " Go from \ref to \label, or from \cite bib entry preview.
 noremap <buffer><silent> gd :call tex_seven#QueryMap()<CR>
 
+" List the uses of a label or citekey, or check all cross-references.
+noremap <buffer><silent> gr :call tex_seven#References()<CR>
+noremap <buffer><silent> <LocalLeader>X :call tex_seven#CheckReferences()<CR>
+
+" Outline of the project, and moving between its headings across files.
+noremap <buffer><silent> <LocalLeader>O :call tex_seven#Outline()<CR>
+noremap <buffer><silent> <LocalLeader>W :call tex_seven#Statistics()<CR>
+nnoremap <buffer><silent> ]] :<C-U>call tex_seven#JumpSection(v:count1)<CR>
+nnoremap <buffer><silent> [[ :<C-U>call tex_seven#JumpSection(-v:count1)<CR>
+
 " Insert mode mappings
 inoremap <buffer> <LocalLeader><LocalLeader> <LocalLeader>
 inoremap <buffer> <LocalLeader>M \
@@ -45,7 +45,6 @@ import logging
 
 from getpass import getuser
 from time import strftime
-from itertools import groupby
 from string import Template
 
 #Local modules
@@ -57,10 +56,17 @@ config = vim.eval('b:tex_seven_config')
 config['disable'] = int(config['disable'])
 config['debug'] = int(config['debug'])
 config['verbose'] = int(config['verbose'])
+config['completion_limit'] = int(config['completion_limit'])
+config['workers'] = int(config['workers'])
+config['check_interval'] = int(config['check_interval'])
 
 sys.path.extend([config['_pypath']])
-from tex_seven_symbols import tex_seven_maths_cache
+from tex_seven_symbols import tex_seven_maths_cache, tex_seven_environments
 from tex_seven_utils import *
+from tex_seven_index import TeXSevenSource, TeXSevenCache, TeXSevenIndex
+from tex_seven_index import find_bibfile, installed_fonts
+from tex_seven_texmf import TeXSevenTeXMF
+from tex_seven_stats import TeXSevenStats, TeXSevenStatistics
 
 # Control debugging
 if config['debug']:
@@ -83,11 +89,45 @@ messages = {
     'NO_BIBSTYLE': r'No valid bibliography style found in the document.',
 }
 
+class TeXSevenVimSource(TeXSevenSource):
+  """Reads files from Vim buffers when they are loaded, so that unsaved
+  changes are seen, and from disk otherwise."""
+
+  def _buffer(self, fname):
+    for b in vim.buffers:
+      if b.name == fname:
+        if int(vim.eval('bufloaded({0})'.format(b.number))):
+          return b
+        break
+    return None
+
+  def stamp(self, fname):
+    b = self._buffer(fname)
+    if b is None:
+      return TeXSevenSource.stamp(self, fname)
+    tick = vim.eval('getbufvar({0}, "changedtick")'.format(b.number))
+    return ('buffer', b.number, int(tick))
+
+  def read(self, fname):
+    b = self._buffer(fname)
+    if b is None:
+      return TeXSevenSource.read(self, fname)
+    return "\n".join(b[:])
+
+  def saved_mtime(self, fname):
+    b = self._buffer(fname)
+    if b is not None and int(vim.eval('getbufvar({0}, "&modified")'.format(b.number))):
+      return None
+    return TeXSevenSource.saved_mtime(self, fname)
+
 class TeXSevenBase(object):
   """Singleton base class for TeX-7."""
 
   _instance = None
   buffers = {}
+  index = TeXSevenIndex(TeXSevenVimSource(), config['workers'])
+  cache = TeXSevenCache(index.source)
+  stats = TeXSevenStatistics(index)
   regexp_modeline = re.compile(r'^\s*%\s*mainfile:\s*(\S+)')
 
   def __new__(self, *args, **kwargs):
@@ -127,9 +167,9 @@ class TeXSevenBase(object):
     Raises `TeXSevenError' if master cannot be found."""
 
     # Most often this is the case
-    for line in vimbuffer:
-      if line.startswith('\\documentclass'):
-        return vimbuffer.name
+    record = self.index.record(vimbuffer.name)
+    if record is not None and record.documentclass is not None:
+      return vimbuffer.name
 
     # Look for modeline
     for line in vimbuffer[:nlines]+vimbuffer[-nlines:]:
@@ -149,19 +189,32 @@ class TeXSevenBase(object):
     raise TeXSevenError(messages['NO_MODELINE'])
 
   def get_master_file(self, vimbuffer):
-    """Returns the filename of the master file."""
+    """Returns the filename of the master file.
+
+    It is looked for again only after `vimbuffer' changes."""
+
+    def build(inputs):
+      inputs.append(vimbuffer.name)
+      return self.find_master_file(vimbuffer)
+
+    master = self.cache.get(('master', vimbuffer.name), build)
+    self.buffers[vimbuffer.name]['master'] = master
 
-    if not self.buffers[vimbuffer.name]['master']:
-      master = self.find_master_file(vimbuffer)
-      self.buffers[vimbuffer.name]['master'] = master
+    # Make sure master knows it's the master
+    masterinfo = self.buffers.get(master)
+    if masterinfo is not None:
+        # masterinfo['master'] = "myself"
+        masterinfo['master'] = master
 
-      # Make sure master knows it's the master
-      masterinfo = self.buffers.get(master)
-      if masterinfo is not None:
-          # masterinfo['master'] = "myself"
-          masterinfo['master'] = master
+    return master
 
-    return self.buffers[vimbuffer.name]['master']
+  def update(self, fnames=None):
+    """Forgets whatever was derived from files that changed since (see
+    TeXSevenCache), looking only at `fnames' if given.
+
+    Called when a file is written, and periodically (see
+    config['check_interval'])."""
+    return self.cache.check(fnames)
 
   @staticmethod
   def multi_file(f):
@@ -215,25 +268,11 @@ class TeXSevenBibTeX(TeXSevenBase):
     omni.bibpaths = [path1, path2,...]
     entries = omni.bibentries
 
-    # Update entries
-    omni.update() #or omni.update(my_new_paths)
+    # Entries are kept until the databases change
+    omni.update() # Check for changed files now
     
     """
 
-    _bibentries = []
-    _bibpaths = set([])
-
-    def _bibparser(self, fname):
-      """Opens a file and extracts all BibTeX entries in it."""
-      try:
-        with open(fname) as f:
-            logging.debug("TeX-7: Reading BibTeX entries from `{0}'".format(path.basename(fname)))
-            return re.findall('^@\w+ *{\s*([^, ]+) *,', f.read(), re.M)
-
-      except IOError:
-        echoerr(messages["INVALID_BIBFILE"].format(fname))
-        return []
-
     @property
     def bibpaths(self):
       return self.get_bibpaths(vim.current.buffer)
@@ -242,70 +281,76 @@ class TeXSevenBibTeX(TeXSevenBase):
     def bibentries(self):
       return self.get_bibentries()
 
-    # Lazy load
     @TeXSevenBase.multi_file
-    def get_bibpaths(self, vimbuffer, update=False):
+    def get_bibpaths(self, vimbuffer):
       """Returns the BibTeX files in a LaTeX project.
 
-      Reads the master file to find out the names of BibTeX files.
-      Files in the compilation folder take precedence over files
-      located in a TDS tree[1].
+      Reads the master file to find out the names of BibTeX files, and
+      looks for them with find_bibfile. The result is kept until the
+      master file or a BibTeX file changes.
+      """
 
-      * Requires the program ``kpsewhich''
-      that is shipped with the standard TeXLive distribution.
+      master = vimbuffer.name
 
-      [1] http://www.tug.org/tds/tds.html#BibTeX
-      """
+      def build(inputs):
+        inputs.append(master)
+        record = self.index.record(master)
+        if record is None:
+          e = messages['MASTER_NOT_ACTIVE'].format(path.basename(master))
+          raise TeXSevenError(e)
 
-      if not self._bibpaths or update:
-        # Find out the bibfiles in use
-        master = vimbuffer.name 
-        masterbuffer = "\n".join(vimbuffer[:])
-        if not masterbuffer:
-            e = messages['MASTER_NOT_ACTIVE'].format(path.basename(master))
-            raise TeXSevenError(e)
-        else:
-          match = re.search(r'\\(?:bibliography|addbibresource){([^}]+)}',
-                            masterbuffer)
-          if not match:
-            return [] # The user might not use BiBTeX...
-
-          bibfiles = match.group(1).split(',')
-          dirname = path.dirname(master)
-          # Find the absolute paths of the bibfiles
-          for b in bibfiles:
-            if not b.endswith('.bib'):
-                b += '.bib'
-
-            # Check if the .bib file is in the compilation folder.
-            bibtemp = path.join(dirname, b)
-            b = ( bibtemp if path.exists(bibtemp) else b )
-            # Get the full path with kspewhich.
-            proc = subprocess.Popen(['kpsewhich','-must-exist', b],
-                                    stdout=subprocess.PIPE)
-            bibpath = proc.communicate()[0].strip(b'\n').decode("utf-8")
-
-            # kpsewhich returns either the full path or an empty string.
-            if bibpath:
-              self._bibpaths.add(bibpath)
-            else:
-              raise TeXSevenError(messages["INVALID_BIBFILE"].format(b))
-
-      return list(self._bibpaths)
+        # Find the absolute paths of the bibfiles
+        bibpaths = []
+        dirname = path.dirname(master)
+        for b in record.bibresources:
+          bibpath = self._find_bibfile(b, dirname, inputs)
+          if not bibpath:
+            raise TeXSevenError(messages["INVALID_BIBFILE"].format(b))
+          if bibpath not in bibpaths:
+            bibpaths.append(bibpath)
+
+        return bibpaths
+
+      return list(self.cache.get(('bibpaths', master), build))
+
+    def _find_bibfile(self, name, folder, inputs):
+      """Returns find_bibfile(name, folder), which is only run again when
+      the database is created in, or removed from, `folder', or when the
+      database found is removed. The files looked at are added to
+      `inputs'."""
+
+      local = path.join(folder, name if name.endswith('.bib') else name + '.bib')
+
+      def build(bibinputs):
+        bibpath = find_bibfile(name, folder)
+        bibinputs += [ local, bibpath ] if bibpath else [ local ]
+        return bibpath
+
+      bibpath = self.cache.get(('bibfile', name, folder), build)
+      inputs += [ local, bibpath ] if bibpath else [ local ]
+      return bibpath
 
     def get_bibentries(self):
-      """Returns a list of BibTeX entries found in the BibTeX files."""
-      if not self._bibentries:
-        bibpaths = self.get_bibpaths(vim.current.buffer)
-        for b in bibpaths:
-          self._bibentries += self._bibparser(b)
-      return self._bibentries
+      """Returns a list of BibTeX entries found in the BibTeX files.
 
-    def update(self):
-      self._bibentries = []
-      self._bibpaths.clear()
+      The .bbl file is used instead, when it is up to date and lists
+      every entry (see TeXSevenIndex.bbl_entries). The list is kept
+      until the databases or the files of the last build change."""
 
-      self.get_bibpaths(vim.current.buffer, update=True)
+      bibpaths = self.get_bibpaths(vim.current.buffer)
+      master = self.get_master_file(vim.current.buffer)
+
+      def build(inputs):
+        base = path.splitext(master)[0]
+        inputs += bibpaths + [ base + ext for ext in ('.aux', '.bbl', '.bcf') ]
+        entries = self.index.bbl_entries(master, bibpaths)
+        if entries is None:
+          entries, unreadable = self.index.bibentries(bibpaths)
+          for b in unreadable:
+            echoerr(messages["INVALID_BIBFILE"].format(b))
+        return entries
+
+      return self.cache.get(('bibentries', master, tuple(bibpaths)), build)
 
 # End class TeXSevenBibTeX
 
@@ -322,10 +367,15 @@ class TeXSevenOmni(TeXSevenBibTeX):
   *   Labels for cross-references
   *   Paths of \include'd files, so you can jump from \\ref to \\label, even across files
   *   Font names when using `fontspec' or 'unicode-math'
+  *   Names of packages and document classes
   *   Picture names when using `graphicx' (EPS, PNG, JPG, PDF)
+  *   Environment names after \begin and \end, including the user's own
   
+  Maths completion also offers the macros defined in the project.
+
   """
-  _incpaths = set([])
+  _worker_results = {}
+  texmf = TeXSevenTeXMF()
 
   @property
   def incpaths(self):
@@ -333,177 +383,278 @@ class TeXSevenOmni(TeXSevenBibTeX):
 
   def __init__(self):
     self.keyword = None
+    self._position = None
+    self._narrowing = None
 
-  # Lazy load
   @TeXSevenBase.multi_file
-  def get_incpaths(self, vimbuffer, update=False):
+  def get_incpaths(self, vimbuffer):
     """Returns the .tex files \included in a LaTeX project.
 
-    Reads the master file to find out the names of .tex files.
+    Reads the master file to find out the names of .tex files. The result
+    is kept until the master file changes, or an \included file appears
+    or disappears.
 
     """
 
-    if not self._incpaths or update:
-      # Find out the \include'd files
-      master = vimbuffer.name
-      masterbuffer = "\n".join(vimbuffer[:])
-      if not masterbuffer:
+    master = vimbuffer.name
+
+    def build(inputs):
+      inputs.append(master)
+      record = self.index.record(master)
+      if record is None:
           e = messages['MASTER_NOT_ACTIVE'].format(path.basename(master))
           raise TeXSevenError(e)
-      else:
-        # incfiles will be a list of strings, each containing the string inside
-        # the curly brackets: \include{...}
-        p = re.compile(r'^\s*\\include{([^}]+)}', re.MULTILINE)
-        incfiles = p.findall(masterbuffer)
-
-        # There might not be any \include'd files.
-        if len(incfiles) == 0:
-          return self._incpaths
-
-        # Find the relative paths of the incfiles, and add them to the _incpaths
-        # array. NB: these have to be relative paths, otherwise completion for
-        # say, \includeonly, will yield absolute path, which is not what we want.
-        for b in incfiles:
-          if b.endswith('.tex'):
-            raise TeXSevenError("\include'd files cannot contain .tex extension: %s!" % b)
-
-          # To check if the file actually exists, we need to add its extension.
-          if path.exists(b + '.tex'):
-            self._incpaths.add(b)
-          else:
-            raise TeXSevenError("Invalid include path: %s!" % b)
-
-    return list(self._incpaths)
+
+      # incfiles will be a list of strings, each containing the string inside
+      # the curly brackets: \include{...}
+      incfiles = [ name for command, name, lineno in record.includes
+                   if command == 'include' ]
+
+      # Find the relative paths of the incfiles. NB: these have to be
+      # relative paths, otherwise completion for say, \includeonly, will
+      # yield absolute path, which is not what we want.
+      incpaths = []
+      dirname = path.dirname(master)
+      for b in incfiles:
+        if b.endswith('.tex'):
+          raise TeXSevenError("\include'd files cannot contain .tex extension: %s!" % b)
+
+        # To check if the file actually exists, we need to add its extension.
+        fname = path.join(dirname, b + '.tex')
+        inputs.append(fname)
+        if not path.exists(fname):
+          raise TeXSevenError("Invalid include path: %s!" % b)
+        if b not in incpaths:
+          incpaths.append(b)
+
+      return incpaths
+
+    return list(self.cache.get(('incpaths', master), build))
 
   @TeXSevenBase.multi_file
-  def _labels(self, vimbuffer,
-            pat=re.compile(r'\\label{(?P<label>[^,}]+)}|\\in(?:clude\*?|put){(?P<fname>[^}]+)}')):
+  def get_project_files(self, vimbuffer):
+    """Returns the master file followed by the files it \include's or
+    \input's, recursively, in document order."""
+    return [ fname for fname, record in self.index.project(vimbuffer.name) ]
+
+  @TeXSevenBase.multi_file
+  def _labels(self, vimbuffer):
     """Labels for references.
 
-    Searches \label{} statements in the master file and in
+    If the document was built after its files were last changed, the
+    labels and their numbers are read from the .aux files. Otherwise
+    searches \label{} statements in the master file and in
     \include'd and \input'd files. 
     
     * Thanks to TeX's clunky design, included files cannot contain
     "special" characters such as whitespace.
     """
 
-    # This fails, but replacing 'update' with 'write' works. But commenting it
-    # out does not seem to hurt anything...
-    # vim.command('update')
-
-    labels = []
-    masterbuffer = "\n".join(vimbuffer[:])
-    master_folder, basename  = path.split(vimbuffer.name)
-    match = pat.findall(masterbuffer)
+    master = vimbuffer.name
 
-    if not match:
-      if not masterbuffer:
-        e = messages['MASTER_NOT_ACTIVE'].format(basename)
-        raise TeXSevenError(e)
-      logging.debug('TeX-7: Found {0} labels'.format(len(labels)))
+    def build(inputs):
+      labels = self.index.labels(master)
+      inputs += self.index.dependencies(master)
+      inputs.append(path.splitext(master)[0] + '.aux')
       return labels
 
-    labels, included = zip(*match)
-    labels = filter(None, labels)
-    included = filter(None, included)
+    labels = self.cache.get(('labels', master), build)
+    if labels is None:
+      e = messages['MASTER_NOT_ACTIVE'].format(path.basename(vimbuffer.name))
+      raise TeXSevenError(e)
 
-    labels = [dict(word=i, menu=basename) for i in labels]
-    for fname in included:
-
-      logging.debug("TeX-7: Reading from included file `{0}'...".format(fname))
-
-      if not fname.endswith('.tex'):
-        fname += '.tex'
-
-      try:
-        with open(path.join(master_folder, fname), 'r') as f:
-          inc_labels = re.findall(r'\\label{(?P<label>[^,}]+)}', f.read())
-          inc_labels = [dict(word=i, menu=fname) for i in inc_labels]
-          labels += inc_labels
-      except IOError as e:
-        # Do not raise an error because the \include statement might
-        # be commented
-        logging.debug(str(e).decode('string_escape'))
-
-    logging.debug('TeX-7: Found {0} labels'.format(len(labels)))
-    return labels
+    return [ TeXSevenCompletion(label, menu) for label, menu in labels ]
 
   def _fonts(self):
     """Installed fonts.
 
     WARNING: Requires fontconfig.
     """
-    proc = subprocess.Popen(['fc-list', ':', 'family'],
-                            stdout=subprocess.PIPE)
-    output = proc.communicate()[0].splitlines()
-    output.sort()
-    output = [ i for i,j in groupby(output, lambda x: re.split('[:,]', x)[0]) ]
-    return output
-
-  def _pics(self):
+    return installed_fonts()
+
+  @TeXSevenBase.multi_file
+  def _packages(self, vimbuffer, extension='.sty'):
+    """Package (or, with extension='.cls', document class) completion.
+
+    Offers the packages in the compilation folder, followed by those
+    installed in the TeX distribution (see TeXSevenTeXMF).
+    """
+    local = [ f[:-len(extension)] for f in os.listdir(path.dirname(vimbuffer.name))
+              if f.endswith(extension) ]
+    installed = self.texmf.packages if extension == '.sty' else self.texmf.classes
+    return sorted(local) + installed
+
+  @TeXSevenBase.multi_file
+  def _pics(self, vimbuffer):
     """Picture completion."
 
-    Checks the compilation directory and its subdirectories.
+    Checks the compilation directory and its subdirectories, as well as
+    the folders given to \graphicspath.
     """
     extensions = [ '.PDF', '.PNG', '.JPG', '.JPEG', '.EPS', 
                   '.pdf', '.png', '.jpg', '.jpeg', '.eps' ]
+    master = vimbuffer.name
+
+    # Folders change when files are added to or removed from them.
+    def build(inputs):
+      p, subdirs, files = next(os.walk(path.dirname(master)))
+      inputs += [ master, p ]
+      pics = [ pic for pic in files if pic[pic.rfind('.'):] in extensions ]
+      for d in subdirs:
+        inputs.append(path.join(p, d))
+        files = os.listdir(path.join(p, d))
+        pics += [ path.join(d, pic) for pic in files if pic[pic.rfind('.'):] in extensions ] 
+
+      # Pictures in \graphicspath can be referred to by their names alone.
+      record = self.index.record(master)
+      for d in (record.graphicspath if record is not None else []):
+        inputs.append(path.join(p, d))
+        try:
+          files = os.listdir(path.join(p, d))
+        except OSError:
+          continue
+        pics += [ pic for pic in files if pic[pic.rfind('.'):] in extensions ]
 
-    p, subdirs, files = next(os.walk(path.dirname(vim.current.buffer.name)))
-    pics = [ pic for pic in files if pic[pic.rfind('.'):] in extensions ]
-    for d in subdirs:
-      files = os.listdir(path.join(p, d))
-      pics += [ path.join(d, pic) for pic in files if pic[pic.rfind('.'):] in extensions ] 
+      return pics
+
+    return list(self.cache.get(('pics', master), build))
+
+  @TeXSevenBase.multi_file
+  def _definitions(self, vimbuffer):
+    """Returns the macros and environments defined in the project, see
+    TeXSevenIndex.definitions()."""
+    return self.index.definitions(vimbuffer.name)
 
-    return pics
+  def _environments(self):
+    """Environment completion.
+
+    The environments defined in the project come first, followed by
+    the standard ones. After \end, the environment that is open at the
+    cursor is offered before anything else.
+    """
+    macros, environments = self._definitions(vim.current.buffer)
+    compl = [ TeXSevenCompletion(name, path.basename(fname))
+              for name, math, fname in environments ]
+    defined = set(c.word for c in compl)
+    compl += [ e for e in tex_seven_environments if e not in defined ]
+
+    if self.keyword == 'end':
+      current = get_latex_environment(vim.current.window)['environment']
+      if current:
+        compl = [ c for c in compl if getattr(c, 'word', c) != current ]
+        compl.insert(0, TeXSevenCompletion(current, 'open'))
+
+    return compl
+
+  def math_completions(self):
+    """Candidates for maths completion: the macros defined in the
+    project, followed by the symbols in tex_seven_maths_cache."""
+    try:
+      macros, environments = self._definitions(vim.current.buffer)
+    except TeXSevenError:
+      macros = []
+
+    user = []
+    for name, nargs, fname in sorted(macros):
+      menu = path.basename(fname)
+      if nargs:
+        menu = "[{0}] {1}".format(nargs, menu)
+      user.append({'word': name, 'menu': menu})
+    return user + tex_seven_maths_cache
+
+  def math_environments(self):
+    """Returns the names of the maths environments defined in the
+    project, for is_latex_math_environment()."""
+    try:
+      macros, environments = self._definitions(vim.current.buffer)
+    except TeXSevenError:
+      return []
+    return [ name for name, math, fname in environments if math ]
 
-  # def findstart(self, pat):
-  def findstart(self, pat=re.compile(r'\\(\w+)(?:[(].+[)])?(?:[\[].+[]])?{?')):
+  def findstart(self):
     """Finds the cursor position where completion starts."""
 
     row, col = vim.current.window.cursor
-    line = vim.current.line[:col]
-    start = max((line.rfind('{'),
-                 line.rfind(','),
-                 line.rfind('\\')))
+    start, self.keyword = find_completion_start(vim.current.line, col)
+    self._position = (vim.current.buffer.number, row, start)
+    return start
+
+  def worker_result(self, method, master, result):
+    """Stores a reply of the indexing worker (see tex_seven_worker.py)."""
+    if result is not None:
+      self._worker_results[(method, master)] = result
+
+  def worker_refresh(self, vimbuffer):
+    """Asks the indexing worker to send its results for the project of
+    `vimbuffer' again, e.g. after one of its files was written. The old
+    results are used until the new ones arrive."""
     try:
-      # Starting at a backslash and there is no keyword.
-      if '\\' in line[col - 1:col]: 
-        self.keyword = ""
-      else:
-        # There can be a keyword: grab it! 
-        self.keyword = pat.findall(line)[-1]
-    except IndexError:
-      self.keyword = None
-
-    finally:
-      if start == -1:
-        pass
-      elif '}' in line[start:]:
-        # Let's not move the cursor too aggresively.
-        start = -1
-        self.keyword = None
-      else:
-        start += 1
+      master = self.get_master_file(vimbuffer)
+    except TeXSevenError:
+      return
+    for method in ('labels', 'bibentries'):
+      self._worker_request(method, master)
+
+  def _worker_request(self, method, master):
+    return int(vim.eval("tex_seven#WorkerRequest('{0}', '{1}')".format(
+                        method, master.replace("'", "''"))))
+
+  def _from_worker(self, method, master=''):
+    """Returns the result of `method' from the indexing worker.
 
-      return start 
+    Returns None if the worker is disabled or cannot be reached: the
+    caller should then do the work itself. Returns False if the result
+    was requested but has not arrived yet."""
 
-  def completions(self):
-    """Selects what type of omni completion should occur."""
+    if not config['worker']:
+      return None
+
+    result = self._worker_results.get((method, master))
+    if result is not None:
+      return result
+    if not self._worker_request(method, master):
+      return None
+
+    echomsg("Indexing the project, please try again in a moment.")
+    return False
+
+  def _candidates(self):
+    """Selects what type of omni completion should occur.
+
+    Returns None if the candidates are still being gathered by the
+    indexing worker."""
 
     compl = []
 
     try:
+      # One batch of checks for changed files per completion.
+      self.update()
+
       # Select completion based on keyword
       if self.keyword is not None:
+        if self.keyword in ('usepackage', 'RequirePackage'):
+          compl = self._packages(vim.current.buffer)
+        elif self.keyword in ('documentclass', 'LoadClass'):
+          compl = self._packages(vim.current.buffer, '.cls')
         # Natbib has \Cite.* type of of commands
-        if 'cite' in self.keyword or 'Cite' in self.keyword: 
-          compl = self.bibentries
+        elif 'cite' in self.keyword or 'Cite' in self.keyword: 
+          compl = self._from_worker('bibentries', self.get_master_file(vim.current.buffer))
+          if compl is None:
+            compl = self.bibentries
         elif 'ref' in self.keyword:
-          compl = self._labels(vim.current.buffer)
+          compl = self._from_worker('labels', self.get_master_file(vim.current.buffer))
+          if compl is None:
+            compl = self._labels(vim.current.buffer)
+          elif compl:
+            compl = [ TeXSevenCompletion(label, menu) for label, menu in compl ]
         elif 'font' in self.keyword or 'setmath' in self.keyword:
-          compl = self._fonts()
+          compl = self._from_worker('fonts')
+          if compl is None:
+            compl = self._fonts()
+        elif self.keyword in ('begin', 'end'):
+          compl = self._environments()
         elif 'includegraphics' in self.keyword:
-          compl = self._pics()
+          compl = self._pics(vim.current.buffer)
         elif 'includeonly' in self.keyword:
           compl = self.incpaths
 
@@ -511,12 +662,38 @@ class TeXSevenOmni(TeXSevenBibTeX):
       echoerr("Omni completion failed: "+str(e))
       compl = []
 
-    return compl
+    return None if compl is False else compl
+
+  def completions(self, base=""):
+    """Returns the completions that match `base', best matches first.
 
-  def update(self):
-    super(TeXSevenOmni, self).update()
+    At most config['completion_limit'] completions are returned (all of
+    them if the limit is 0). The matches are remembered until the end of
+    the insertion, so that when the user keeps typing, narrowing them
+    down does not require gathering all the candidates again."""
 
-    self.get_incpaths(vim.current.buffer, update=True)
+    key = (self.keyword, self._position)
+    last = self._narrowing
+    if last is not None and last[0] == key and base.startswith(last[1]):
+      candidates = last[2]
+    else:
+      candidates = self._candidates()
+      if candidates is None:
+        return []
+
+    matches = filter_completions(candidates, base)
+    self._narrowing = (key, base, matches)
+
+    limit = config['completion_limit']
+    if limit > 0:
+      matches = matches[:limit]
+
+    # Only the completions handed over to Vim are turned into dictionaries.
+    return [ c if isinstance(c, str) else c.as_dict() for c in matches ]
+
+  def forget_completions(self):
+    """Drops the matches remembered by completions()."""
+    self._narrowing = None
 
 # End class TeXSevenOmni
 
@@ -528,6 +705,7 @@ class TeXSevenDocument(TeXSevenBase):
   * Compile a LaTeX document updating the BibTeX references as well
   * Launch a viewer application
   * Preview the definition of a BibTeX entry based on its keyword
+  * Show the outline and the word counts of the project
 
   Methods that are decorated with TeXSevenBase.multi_file are designed
   to also work in multi-file LaTeX projects."""
@@ -538,6 +716,8 @@ class TeXSevenDocument(TeXSevenBase):
   # To match things like \cite[ibid.]{foo} or \nocite{bar} or \cite{baz}.
   regexp_bibqueries = re.compile(r'\\(no)?cite.?(\[.+\])?{(\S+)}')
 
+  _word_counts = {} # Master file (or buffer) -> count shown by word_count()
+
   def __init__(self, vimbuffer):
     TeXSevenBase.add_buffer(self, vimbuffer)
     self.biberrors = []
@@ -617,20 +797,20 @@ class TeXSevenDocument(TeXSevenBase):
       echomsg("Functionality not available with command \\{}".format(ref_command))
       return
 
-    # Label not found in current file, so search \include'd files.
+    # Search the current file first, then the rest of the project.
     for fname in [vim.current.buffer.name] + paths:
-      try:
-        with open(fname, 'r') as f:
-          txt = f.read()
-          fname = fname.replace(' ', '\ ')
-      except IOError as io:
-        echoerr("Cannot lookup label `{}': {}".format(key, str(io)))
+      record = self.index.record(fname)
+      if record is None:
+        echoerr("Cannot lookup label `{}': cannot read {}".format(key, fname))
         return
 
       # First match wins (labels are suppose to be unique).
-      if re.search("\\label\{"+key+"\}", txt, re.M):
+      for label, lineno in record.labels:
+        if label != key:
+          continue
         try:
-          vim.command("pedit +/{0} {1}".format(key, fname))
+          fname = fname.replace(' ', '\ ')
+          vim.command("pedit +{0} {1}".format(lineno, fname))
           vim.command('windo if &pvw|normal zR|endif') # Unfold
           vim.command("redraw") # Needed after opening a preview window.
         except vim.error as v:
@@ -639,7 +819,235 @@ class TeXSevenDocument(TeXSevenBase):
         return
 
     # If control reaches here, then no matches were found, either on the
-    # current file, or in the \include'd ones.
+    # current file, or in the \include'd or \input'd ones.
     echomsg("Could not find label for key: {0}".format(key))
 
+  @staticmethod
+  def _quickfix(title, items, loclist=False):
+    """Fills the quickfix list with `items', tuples (fname, lineno, text),
+    and opens it. With loclist=True, the location list of the current
+    window is used instead."""
+
+    items = [ {'filename': fname, 'lnum': lineno, 'text': text}
+              for fname, lineno, text in items ]
+    what = {'title': title, 'items': items}
+    if loclist:
+      vim.Function('setloclist')(0, [], ' ', what)
+    else:
+      vim.Function('setqflist')([], ' ', what)
+    if items:
+      vim.command('lopen' if loclist else 'copen')
+    else:
+      echomsg("{0}: nothing found.".format(title))
+
+  def outline(self, vimbuffer):
+    """Shows the parts, chapters, sections etc. of the whole project in
+    the location list, indented by depth."""
+
+    outline = self.index.outline(self.get_master_file(vimbuffer))
+    top = min([ level for level, title, label, fname, lineno in outline ] or [0])
+    items = []
+    for level, title, label, fname, lineno in outline:
+      text = '  ' * (level - top) + title
+      if label is not None:
+        text += "  [{0}]".format(label)
+      items.append((fname, lineno, text))
+
+    self._quickfix("Outline", items, loclist=True)
+
+  def statistics(self, vimbuffer):
+    """Shows the number of words, equations, figures and citations of
+    each section and of each file of the project in the location list."""
+
+    master = self.get_master_file(vimbuffer)
+    sections, files = self.stats.statistics(master)
+    top = min([ heading[0] for heading, stats in sections if heading ] or [0])
+
+    items = []
+    for heading, stats in sections:
+      if heading is None:
+        if stats.words or stats.equations or stats.figures or stats.citations:
+          items.append((master, 1, "(Before the first heading): {0}".format(stats)))
+        continue
+      level, title, label, fname, lineno = heading
+      items.append((fname, lineno, "{0}{1}: {2}".format('  ' * (level - top), title, stats)))
+
+    total = sum((stats for fname, stats in files), TeXSevenStats())
+    items += [ (fname, 1, "File {0}: {1}".format(path.basename(fname), stats))
+               for fname, stats in files ]
+    self._quickfix("Statistics: {0}".format(total), items, loclist=True)
+
+  def word_count(self, vimbuffer):
+    """Returns the number of words of the project, for the status line.
+
+    As this is called on every redraw of the status line, it returns the
+    count last made by count_words(), which runs when the user stops
+    typing. Only the first call counts the words itself. Buffers that
+    TeX-7 does not know about, e.g. with a global 'statusline', get an
+    empty string."""
+
+    bufinfo = self.buffers.get(vimbuffer.name)
+    if bufinfo is None:
+      return ""
+
+    count = self._word_counts.get(bufinfo.get('master') or vimbuffer.name)
+    if count is None:
+      count = self.count_words(vimbuffer, force=True)
+    return count
+
+  def count_words(self, vimbuffer, force=False):
+    """Brings the count of word_count() up to date, if it is in use (or
+    if `force' is true), and redraws the status lines if it changed.
+
+    The count is kept until a file of the project changes; only the
+    sections that changed are counted again (see TeXSevenStatistics)."""
+
+    bufinfo = self.buffers.get(vimbuffer.name)
+    if bufinfo is None:
+      return ""
+    if not force and (bufinfo.get('master') or vimbuffer.name) not in self._word_counts:
+      return None
+
+    self.update([vimbuffer.name])
+    try:
+      master = self.get_master_file(vimbuffer)
+    except TeXSevenError:
+      # Remembered under the name of the buffer, so that the master file
+      # is looked for again when the user stops typing, not on every
+      # redraw.
+      self._word_counts[vimbuffer.name] = ""
+      return ""
+
+    def build(inputs):
+      inputs += self.index.dependencies(master)
+      return "{0} words".format(self.stats.total(master).words)
+
+    count = self.cache.get(('words', master), build)
+    if self._word_counts.get(master) != count:
+      self._word_counts[master] = count
+      if not force:
+        vim.command('redrawstatus!')
+    return count
+
+  def jump_section(self, vimbuffer, count):
+    """Moves the cursor `count' headings forwards (or backwards, if count
+    is negative) in the outline of the project, going into other files
+    if need be."""
+
+    master = self.get_master_file(vimbuffer)
+    outline = self.index.outline(master)
+    position = self.index.locator(master)
+    here = position(vimbuffer.name, vim.current.window.cursor[0])
+    if here is None:
+      echomsg("File is not part of the project.")
+      return
+
+    positions = [ position(fname, lineno)
+                  for level, title, label, fname, lineno in outline ]
+    if count > 0:
+      after = [ i for i, p in enumerate(positions) if p > here ]
+      target = after[0] + count - 1 if after else len(outline)
+    else:
+      before = [ i for i, p in enumerate(positions) if p < here ]
+      target = before[-1] + count + 1 if before else -1
+
+    if not 0 <= target < len(outline):
+      echomsg("No more headings.")
+      return
+
+    level, title, label, fname, lineno = outline[target]
+    try:
+      vim.command("normal! m'") # Allow jumping back with ''
+      if fname == vimbuffer.name:
+        vim.current.window.cursor = (lineno, 0)
+      else:
+        vim.command("edit +{0} {1}".format(lineno, fname.replace(' ', '\ ')))
+    except vim.error as v:
+      echomsg("Vim error {}".format(str(v)))
+
+  def references(self, vimbuffer, omni):
+    """Lists in the quickfix list where the label or citekey under the
+    cursor is defined, and everywhere it is used in the project.
+
+    The BibTeX databases are looked up through `omni' (a TeXSevenBibTeX)
+    only for a citekey."""
+
+    row, col = vim.current.window.cursor
+    command, key = find_argument(vim.current.line, col)
+    if command is None:
+      echomsg("No label or citekey under the cursor.")
+      return
+
+    master = self.get_master_file(vimbuffer)
+    crossrefs = self.index.crossrefs(master)
+    if command == 'label' or command.endswith('ref'):
+      items = [ (fname, lineno, "\\label{{{0}}}".format(key))
+                for fname, lineno in crossrefs['labels'].get(key, []) ]
+      items += [ (fname, lineno, "Reference to `{0}'".format(key))
+                 for fname, lineno in crossrefs['references'].get(key, []) ]
+    elif 'cite' in command or 'Cite' in command:
+      bibpaths = omni.get_bibpaths(vimbuffer)
+      location = self.index.bibentry_locations(bibpaths).get(key)
+      items = [ location + ("BibTeX entry `{0}'".format(key),) ] if location else []
+      items += [ (fname, lineno, "Citation of `{0}'".format(key))
+                 for fname, lineno in crossrefs['citations'].get(key, []) ]
+    else:
+      echomsg("Functionality not available with command \\{}".format(command))
+      return
+
+    self._quickfix("References to {0}".format(key), items)
+
+  def check_references(self, vimbuffer, omni):
+    """Lists in the quickfix list the unused and multiply defined labels,
+    the undefined references and citations, and the BibTeX entries that
+    are never cited.
+
+    The BibTeX databases are looked up through `omni' (a TeXSevenBibTeX);
+    if that fails, the labels and references are still checked."""
+
+    master = self.get_master_file(vimbuffer)
+    crossrefs = self.index.crossrefs(master)
+    labels = crossrefs['labels']
+    references = crossrefs['references']
+    citations = crossrefs['citations']
+
+    items = []
+    for key, places in labels.items():
+      if len(places) > 1:
+        items += [ (fname, lineno, "Label `{0}' multiply defined".format(key))
+                   for fname, lineno in places ]
+      if key not in references:
+        items += [ (fname, lineno, "Unused label `{0}'".format(key))
+                   for fname, lineno in places ]
+
+    for key, places in references.items():
+      if key not in labels:
+        items += [ (fname, lineno, "Undefined reference `{0}'".format(key))
+                   for fname, lineno in places ]
+
+    try:
+      bibpaths = omni.get_bibpaths(vimbuffer)
+    except TeXSevenError as e:
+      bibpaths = []
+      bibfailure = e
+    else:
+      bibfailure = None
+
+    if bibpaths:
+      entries = self.index.bibentry_locations(bibpaths)
+      for key, places in citations.items():
+        if key != '*' and key not in entries:
+          items += [ (fname, lineno, "Undefined citation `{0}'".format(key))
+                     for fname, lineno in places ]
+
+      # With \\nocite{*} every entry is cited.
+      if '*' not in citations:
+        items += [ (fname, lineno, "Uncited BibTeX entry `{0}'".format(key))
+                   for key, (fname, lineno) in entries.items()
+                   if key not in citations ]
+
+    self._quickfix("Cross-reference check", items)
+    if bibfailure is not None:
+      echoerr("Citations not checked: {0}".format(bibfailure))
+
 logging.debug("TeX-7: Done with the Python module.")
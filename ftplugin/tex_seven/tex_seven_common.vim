@@ -31,12 +31,16 @@ let &dictionary = fnameescape(s:path.'/tex_dictionary.txt')
 
 " Defaults
 let b:tex_seven_config = { 
+      \    'check_interval' : 5,
+      \    'completion_limit' : 200,
       \    'debug'        : 0,
       \    'disable'      : 0,
       \    'leader'       : '',
       \    'diamond_tex'  : '0',
       \    'verbose'      : 0,
       \    'viewer'       : {'app': 'xdg-open', 'target': 'pdf'},
+      \    'worker'       : '',
+      \    'workers'      : 0,
       \}
 
 " Override values with user preferences
@@ -0,0 +1,1062 @@
+# -*- coding: utf-8 -*-
+
+# LaTeX filetype plugin
+# Languages:    Python
+# Maintainer:   Óscar Pereira
+# Version:      0.1
+# License:      GPL
+
+#************************************************************************
+#
+#                     TeX-7 library: Vim script
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#    Copyright Elias Toivanen, 2011-2014
+#    Copyright Óscar Pereira, 2020
+#
+#************************************************************************
+
+# Short summary of the module:
+#
+# A single-pass, comment-aware scanner for LaTeX sources, and an index
+# that caches what the scanner found in each file of a project. This
+# module does not import vim, so that it can also be used outside of
+# Vim's embedded interpreter.
+
+import os
+import os.path as path
+import re
+import sys
+import logging
+import subprocess
+import multiprocessing
+
+from itertools import groupby
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import BrokenExecutor
+
+# A % that is not escaped, i.e. preceded by an even number of backslashes,
+# starts a comment that runs until the end of the line.
+regexp_comment = re.compile(r'(?<!\\)((?:\\\\)*)%.*$', re.M)
+
+# The commands the scanner knows about. Everything else is skipped.
+regexp_command = re.compile(r'\\(documentclass|usepackage|RequirePackage'
+                            r'|bibliography|addbibresource|include|input'
+                            r'|label|graphicspath|newcommand|renewcommand'
+                            r'|providecommand|DeclareMathOperator|def'
+                            r'|newenvironment|renewenvironment|newtheorem'
+                            r'|part|chapter|(?:sub)*section|(?:sub)?paragraph'
+                            r'|(?:eq|page|auto|name|c|C|v|V)?ref|labelcref'
+                            r'|[a-zA-Z]*[cC]ite[a-zA-Z]*)'
+                            r'(?![a-zA-Z@])(\*?)')
+
+regexp_csname = re.compile(r'\\(?:[a-zA-Z@]+|.)')
+
+# Depth of each sectioning command in the outline of a document.
+section_levels = {'part': 0, 'chapter': 1, 'section': 2, 'subsection': 3,
+                  'subsubsection': 4, 'paragraph': 5, 'subparagraph': 6}
+
+regexp_heading_label = re.compile(r'\s*\\label\s*{([^}]*)}')
+
+# Environments whose contents are typeset in maths mode.
+regexp_math_environment = re.compile(r'matrix|cases|math|equation|align|array'
+                                     r'|gather|multline|flalign')
+
+class TeXSevenFileRecord(object):
+  """What the scanner found in a single LaTeX file.
+
+  Line numbers are 1-based, as in Vim.
+
+  documentclass: name of the document class, or None
+  packages:      names of the packages loaded with \\usepackage
+  bibresources:  names given to \\bibliography or \\addbibresource
+  includes:      (command, name, lineno) for each \\include and \\input
+  labels:        (label, lineno) for each \\label
+  references:    (label, lineno) for each label used in \\ref and friends
+  citations:     (key, lineno) for each key used in \\cite and friends
+  graphicspath:  folders given to \\graphicspath
+  macros:        (name, nargs, lineno) for each macro definition
+  environments:  (name, math, lineno) for each environment definition,
+                 where `math' tells whether its contents are in maths mode
+  sections:      (command, title, label, lineno) for each sectioning
+                 command; label is that of a \label right after it, or None
+  """
+
+  __slots__ = ('documentclass', 'packages', 'bibresources', 'includes',
+               'labels', 'references', 'citations', 'graphicspath',
+               'macros', 'environments', 'sections')
+
+  def __init__(self):
+    self.documentclass = None
+    self.packages = []
+    self.bibresources = []
+    self.includes = []
+    self.labels = []
+    self.references = []
+    self.citations = []
+    self.graphicspath = []
+    self.macros = []
+    self.environments = []
+    self.sections = []
+
+def strip_comments(text):
+  """Removes LaTeX comments from `text', keeping the line breaks."""
+  return regexp_comment.sub(r'\1', text)
+
+def _skip_space(text, pos):
+  while pos < len(text) and text[pos] in ' \t\n':
+    pos += 1
+  return pos
+
+def _group(text, pos, opening='{', closing='}'):
+  """Reads a balanced group starting at `pos'.
+
+  Returns a tuple (content, end), where `end' is the position just after
+  the closing delimiter. If there is no group at `pos', or it is not
+  closed, returns (None, pos)."""
+
+  if pos >= len(text) or text[pos] != opening:
+    return None, pos
+
+  depth = 0
+  i = pos
+  while i < len(text):
+    c = text[i]
+    if c == '\\':
+      i += 2
+      continue
+    elif c == opening:
+      depth += 1
+    elif c == closing:
+      depth -= 1
+      if depth == 0:
+        return text[pos+1:i], i + 1
+    i += 1
+
+  return None, pos
+
+def _arguments(text, pos):
+  """Reads the arguments of a command starting at `pos'.
+
+  Returns a tuple (optional, mandatory, end): the contents of the leading
+  [...] arguments, the contents of the first {...} argument (or None) and
+  the position where scanning should continue."""
+
+  optional = []
+  while True:
+    start = _skip_space(text, pos)
+    opt, end = _group(text, start, '[', ']')
+    if opt is None:
+      break
+    optional.append(opt)
+    pos = end
+
+  start = _skip_space(text, pos)
+  mandatory, end = _group(text, start)
+  if mandatory is None:
+    return optional, None, pos
+  return optional, mandatory, end
+
+def _csname(text, pos):
+  """Reads the name of the macro being defined, either as \\foo or {\\foo}.
+
+  Returns (name, end); name is None if there is no macro name."""
+
+  start = _skip_space(text, pos)
+  arg, end = _group(text, start)
+  if arg is not None:
+    match = regexp_csname.match(arg.strip())
+    return (match.group(0)[1:] if match else None), end
+
+  match = regexp_csname.match(text, start)
+  if match:
+    return match.group(0)[1:], match.end()
+  return None, pos
+
+def _split(arg):
+  return [ i.strip() for i in arg.split(',') if i.strip() ]
+
+def _is_math(code):
+  """Tells whether the begin code of an environment switches to maths
+  mode, i.e. it opens a display or a maths environment."""
+
+  if not code:
+    return False
+  if '\\[' in code or '$$' in code:
+    return True
+  return any(regexp_math_environment.search(name) for name in
+             re.findall(r'\\begin\s*{([^}]*)}', code))
+
+def scan_latex(text):
+  """Scans the LaTeX source `text' once, ignoring comments.
+
+  Returns a TeXSevenFileRecord."""
+
+  record = TeXSevenFileRecord()
+  text = strip_comments(text)
+
+  # Headings only count in the body of the document, and not in the
+  # definitions of macros or environments.
+  document = text.find('\\begin{document}')
+  definitions = 0 # End of the last definition
+
+  # Line numbers are counted incrementally, as matches come in order.
+  lineno, counted = 1, 0
+  pos = 0
+  while True:
+    match = regexp_command.search(text, pos)
+    if not match:
+      break
+
+    lineno += text.count('\n', counted, match.start())
+    counted = match.start()
+    command = match.group(1)
+    pos = match.end()
+
+    if command == 'documentclass':
+      optional, arg, pos = _arguments(text, pos)
+      if arg is not None and record.documentclass is None:
+        record.documentclass = arg.strip()
+
+    elif command in ('usepackage', 'RequirePackage'):
+      optional, arg, pos = _arguments(text, pos)
+      if arg is not None:
+        record.packages += _split(arg)
+
+    elif command in ('bibliography', 'addbibresource'):
+      optional, arg, pos = _arguments(text, pos)
+      if arg is not None:
+        record.bibresources += _split(arg)
+
+    elif command in ('include', 'input'):
+      start = _skip_space(text, pos)
+      arg, end = _group(text, start)
+      if arg is None and command == 'input':
+        # Plain TeX syntax: \input file
+        name = re.match(r'[^\s\\{}]*', text[start:]).group(0)
+        arg, end = (name or None), start + len(name)
+      if arg is not None and arg.strip():
+        record.includes.append((command, arg.strip(), lineno))
+        pos = end
+
+    elif command == 'label':
+      optional, arg, pos = _arguments(text, pos)
+      if arg is not None:
+        record.labels.append((sys.intern(arg.strip()), lineno))
+
+    elif command.endswith('ref'):
+      optional, arg, pos = _arguments(text, pos)
+      if arg is not None:
+        record.references += [ (sys.intern(i), lineno) for i in _split(arg) ]
+
+    elif 'cite' in command or 'Cite' in command:
+      optional, arg, pos = _arguments(text, pos)
+      if arg is not None:
+        record.citations += [ (sys.intern(i), lineno) for i in _split(arg) ]
+
+    elif command in ('newenvironment', 'renewenvironment'):
+      # \newenvironment{name}[nargs][default]{begin code}{end code}
+      optional, arg, pos = _arguments(text, pos)
+      if arg is None:
+        continue
+      optional, begin, pos = _arguments(text, pos)
+      record.environments.append((arg.strip(), _is_math(begin), lineno))
+      optional, end_code, end = _arguments(text, pos)
+      definitions = max(definitions, end)
+
+    elif command == 'newtheorem':
+      optional, arg, pos = _arguments(text, pos)
+      if arg is not None:
+        record.environments.append((arg.strip(), False, lineno))
+
+    elif command in section_levels:
+      if match.start() < document or match.start() < definitions:
+        continue
+
+      # The title may contain labels, citations etc., so keep scanning
+      # inside it.
+      optional, title, end = _arguments(text, pos)
+      if title is not None:
+        label = regexp_heading_label.match(text, end)
+        title = ' '.join(title.split())
+        record.sections.append((command, title,
+                                label.group(1).strip() if label else None,
+                                lineno))
+
+    elif command == 'graphicspath':
+      optional, arg, pos = _arguments(text, pos)
+      if arg is not None:
+        record.graphicspath += re.findall(r'{([^{}]*)}', arg)
+
+    else:
+      # \newcommand and friends, \DeclareMathOperator and \def
+      name, pos = _csname(text, pos)
+      if name is None:
+        continue
+
+      nargs = 0
+      if command == 'def':
+        # Count the parameters in the parameter text, e.g. \def\foo#1#2{...}
+        brace = text.find('{', pos)
+        if brace != -1:
+          nargs = len(re.findall(r'#\d', text[pos:brace]))
+          body, end = _group(text, brace)
+          definitions = max(definitions, end)
+      else:
+        start = _skip_space(text, pos)
+        opt, end = _group(text, start, '[', ']')
+        if command != 'DeclareMathOperator' and opt is not None and opt.strip().isdigit():
+          nargs = int(opt.strip())
+          pos = end
+        # The body comes after the default value of the first argument, if any.
+        optional, body, end = _arguments(text, pos)
+        definitions = max(definitions, end)
+
+      record.macros.append((name, nargs, lineno))
+
+  return record
+
+class TeXSevenAuxRecord(object):
+  """What was found in a .aux file written by LaTeX.
+
+  labels:    (label, number, page) for each \newlabel
+  citations: keys given to \citation, in order of appearance
+  inputs:    names of the .aux files read with \@input, e.g. those of
+             \include'd files
+  """
+
+  __slots__ = ('labels', 'citations', 'inputs')
+
+  def __init__(self):
+    self.labels = []
+    self.citations = []
+    self.inputs = []
+
+regexp_aux = re.compile(r'\\(newlabel|citation|@input)\{([^{}]*)\}')
+
+def scan_aux(text):
+  """Scans the contents of a .aux file. Returns a TeXSevenAuxRecord."""
+
+  record = TeXSevenAuxRecord()
+  for match in regexp_aux.finditer(text):
+    command, arg = match.groups()
+    if command == 'newlabel':
+      # \newlabel{key}{{number}{page}...}, possibly with more groups
+      # after the page when hyperref is used.
+      if arg.endswith('@cref') or arg.startswith('sub@'):
+        # Duplicates written by cleveref, subcaption and subfig.
+        continue
+      data, end = _group(text, match.end())
+      if data is None:
+        continue
+      number, end = _group(data, 0)
+      page, end = _group(data, end)
+      if number is None or page is None:
+        # Not a label, e.g. \newlabel{tocindent0}{0pt}
+        continue
+      record.labels.append((sys.intern(arg), number, page))
+    elif command == 'citation':
+      record.citations += _split(arg)
+    else:
+      record.inputs.append(arg)
+
+  return record
+
+def scan_bbl(text):
+  """Returns the keys of the entries in a .bbl file.
+
+  Both the output of BibTeX (\bibitem) and of biber (\entry) are read."""
+
+  return re.findall(r'\\(?:bibitem(?:\[[^]]*\])?|entry)\s*\{([^{}]+)\}', text)
+
+def scan_bcf(text):
+  """Returns the cited keys listed in a biber control file (.bcf)."""
+  return re.findall(r'<bcf:citekey[^>]*>([^<]+)</bcf:citekey>', text)
+
+def scan_fls(text):
+  """Returns the names of the files read by LaTeX, as listed in a .fls
+  file (written with -recorder, e.g. by latexmk). Relative names are
+  joined to the folder LaTeX ran in."""
+
+  folder = ''
+  fnames = []
+  for line in text.splitlines():
+    if line.startswith('PWD '):
+      folder = line[4:]
+    elif line.startswith('INPUT '):
+      fname = path.normpath(path.join(folder, line[6:]))
+      if fname not in fnames:
+        fnames.append(fname)
+  return fnames
+
+def parse_bibfile(fname):
+  """Returns a tuple (keys, linenos): the keys of the entries in the
+  BibTeX database `fname', and the lines where they are defined.
+
+  Raises IOError if the file cannot be read."""
+
+  with open(fname, 'r', encoding='utf-8', errors='replace') as f:
+    text = f.read()
+
+  keys = []
+  linenos = []
+  lineno, counted = 1, 0
+  for match in re.finditer(r'^@\w+ *{\s*([^, ]+) *,', text, re.M):
+    lineno += text.count('\n', counted, match.start())
+    counted = match.start()
+    keys.append(match.group(1))
+    linenos.append(lineno)
+  return keys, linenos
+
+def find_bibfile(name, folder):
+  """Returns the full path of the BibTeX database `name', or None if it
+  cannot be found.
+
+  Files in the compilation folder `folder' take precedence over files
+  located in a TDS tree[1].
+
+  * Requires the program ``kpsewhich''
+  that is shipped with the standard TeXLive distribution.
+
+  [1] http://www.tug.org/tds/tds.html#BibTeX
+  """
+
+  if not name.endswith('.bib'):
+    name += '.bib'
+
+  # Check if the .bib file is in the compilation folder.
+  local = path.join(folder, name)
+  name = ( local if path.exists(local) else name )
+  # Get the full path with kpsewhich.
+  proc = subprocess.Popen(['kpsewhich','-must-exist', name],
+                          stdout=subprocess.PIPE)
+  bibpath = proc.communicate()[0].strip(b'\n').decode("utf-8")
+
+  # kpsewhich returns either the full path or an empty string.
+  return bibpath or None
+
+def installed_fonts():
+  """Returns the names of the installed font families.
+
+  WARNING: Requires fontconfig.
+  """
+  proc = subprocess.Popen(['fc-list', ':', 'family'],
+                          stdout=subprocess.PIPE)
+  output = proc.communicate()[0].decode('utf-8').splitlines()
+  output.sort()
+  output = [ i for i,j in groupby(output, lambda x: re.split('[:,]', x)[0]) ]
+  return output
+
+def _parse_bibfile(fname):
+  # Errors are returned rather than raised, so that one bad database
+  # does not cancel the others when parsing in parallel.
+  try:
+    return parse_bibfile(fname)
+  except IOError:
+    return None
+
+# Below this total size, files are scanned in the calling process: a
+# scan takes about 0.2 seconds per megabyte, not worth sending the files
+# to other processes.
+parallel_min_bytes = 1024 * 1024
+
+_executors = {}
+
+def _executor(workers):
+  """Returns the pool of `workers' processes used by parallel_map. It is
+  created the first time it is needed and kept for the whole session.
+
+  Processes are forked, because inside Vim there is no Python executable
+  to spawn; where forking is not available, threads are used instead."""
+
+  executor = _executors.get(workers)
+  if executor is None:
+    try:
+      context = multiprocessing.get_context('fork')
+      executor = ProcessPoolExecutor(workers, mp_context=context)
+    except ValueError:
+      executor = ThreadPoolExecutor(workers)
+    _executors[workers] = executor
+  return executor
+
+def parallel_map(func, items, workers=0, size=0):
+  """Returns [func(i) for i in items], in the same order.
+
+  If `workers' is greater than one and the items amount to `size' bytes,
+  at least parallel_min_bytes, the calls are spread over a pool of that
+  many processes (see _executor). `func' must be a module level
+  function."""
+
+  items = list(items)
+  if workers <= 1 or len(items) <= 1 or size < parallel_min_bytes:
+    return [ func(i) for i in items ]
+
+  try:
+    return list(_executor(workers).map(func, items))
+  except BrokenExecutor as e:
+    logging.debug("TeX-7: Worker processes failed: {0}".format(e))
+    del _executors[workers]
+    return [ func(i) for i in items ]
+
+def _same_records(a, b):
+  """Returns True if the lists of tuples (fname, record) `a' and `b' hold
+  the very same records, i.e. none of the files was scanned again."""
+  return len(a) == len(b) and all(i[0] == j[0] and i[1] is j[1]
+                                  for i, j in zip(a, b))
+
+class TeXSevenSource(object):
+  """Gives access to the contents of files, read from disk.
+
+  stamp() returns a value that changes whenever the contents of the file
+  change, or None if the file cannot be read. Subclasses may read files
+  from somewhere else, e.g. from Vim buffers."""
+
+  def stamp(self, fname):
+    try:
+      st = os.stat(fname)
+    except OSError:
+      return None
+    return (st.st_mtime, st.st_size)
+
+  def read(self, fname):
+    with open(fname, 'r', encoding='utf-8', errors='replace') as f:
+      return f.read()
+
+  def saved_mtime(self, fname):
+    """Returns the time `fname' was last written to disk, or None if it
+    cannot be read or if it has unsaved changes."""
+    try:
+      return os.stat(fname).st_mtime
+    except OSError:
+      return None
+
+class TeXSevenCache(object):
+  """Values derived from files, e.g. the BibTeX databases or the labels of
+  a project, each kept along with the stamps (see TeXSevenSource) of the
+  files it was built from.
+
+  Stamps are not looked at when a value is asked for: check() compares
+  all of them in one batch, each file once, and forgets the values whose
+  files changed. They are built again the next time they are needed,
+  while the others are kept.
+  """
+
+  def __init__(self, source=None):
+    self.source = source if source is not None else TeXSevenSource()
+    self._values = {}
+
+  def get(self, key, build):
+    """Returns the value stored under `key'. If there is none, stores
+    build(inputs), where `inputs' is a list to which build() appends the
+    names of the files it reads. They may include files that do not exist
+    (yet), e.g. an .aux file before the document is built."""
+
+    cached = self._values.get(key)
+    if cached is not None:
+      return cached[0]
+
+    inputs = []
+    value = build(inputs)
+    stamps = dict((fname, self.source.stamp(fname)) for fname in inputs)
+    self._values[key] = (value, stamps)
+    return value
+
+  def check(self, fnames=None):
+    """Forgets the values built from files that changed, looking only at
+    `fnames' if given. Returns the keys of the values forgotten."""
+
+    stamps = {}
+    stale = []
+    for key, (value, inputs) in self._values.items():
+      for fname, stamp in inputs.items():
+        if fnames is not None and fname not in fnames:
+          continue
+        if fname not in stamps:
+          stamps[fname] = self.source.stamp(fname)
+        if stamps[fname] != stamp:
+          stale.append(key)
+          break
+
+    for key in stale:
+      logging.debug("TeX-7: {0} is out of date".format(key))
+      del self._values[key]
+    return stale
+
+  def clear(self):
+    self._values.clear()
+
+class TeXSevenIndex(object):
+  """Caches one TeXSevenFileRecord per file.
+
+  A file is scanned again only when its stamp (see TeXSevenSource)
+  changes, so asking repeatedly for the same record is cheap.
+
+  The index also reads the files written when building the document
+  (.aux, .bbl and .bcf), which after a build already know every label,
+  with its number, and every cited key.
+  """
+
+  def __init__(self, source=None, workers=0):
+    self.source = source if source is not None else TeXSevenSource()
+    self.workers = workers
+    self._records = {}
+    self._artifacts = {}
+    self._bibfiles = {}
+    self._merged = {}
+
+  def _scan(self, fnames):
+    """Brings the records of `fnames' up to date.
+
+    The files are read in the calling thread (the source may be Vim, which
+    is not thread-safe), and the stale ones are scanned with parallel_map
+    if they are large enough."""
+
+    stale = []
+    texts = []
+    for fname in fnames:
+      stamp = self.source.stamp(fname)
+      cached = self._records.get(fname)
+      if stamp is not None and cached is not None and cached[0] == stamp:
+        continue
+
+      self._records.pop(fname, None)
+      if stamp is None:
+        continue
+
+      logging.debug("TeX-7: Scanning `{0}'".format(path.basename(fname)))
+      try:
+        texts.append(self.source.read(fname))
+      except IOError as e:
+        logging.debug("TeX-7: Cannot scan `{0}': {1}".format(fname, e))
+        continue
+      stale.append((fname, stamp))
+
+    size = sum(len(text) for text in texts)
+    records = parallel_map(scan_latex, texts, self.workers, size)
+    for (fname, stamp), record in zip(stale, records):
+      self._records[fname] = (stamp, record)
+
+  def record(self, fname):
+    """Returns the record of `fname', or None if it cannot be read."""
+
+    self._scan([fname])
+    cached = self._records.get(fname)
+    return cached[1] if cached is not None else None
+
+  def _parse_bibfiles(self, bibpaths):
+    """Brings the parsed contents of the databases `bibpaths' up to date.
+
+    Databases are parsed again only when they change, and if there are
+    several large ones to parse, they are parsed with parallel_map."""
+
+    stale = []
+    for fname in bibpaths:
+      stamp = TeXSevenSource.stamp(self.source, fname)
+      cached = self._bibfiles.get(fname)
+      if stamp is None or cached is None or cached[0] != stamp:
+        stale.append((fname, stamp))
+
+    size = sum(stamp[1] for fname, stamp in stale if stamp is not None)
+    entries = parallel_map(_parse_bibfile, [ i[0] for i in stale ],
+                           self.workers, size)
+    for (fname, stamp), parsed in zip(stale, entries):
+      logging.debug("TeX-7: Read BibTeX entries from `{0}'".format(path.basename(fname)))
+      if parsed is None:
+        self._bibfiles.pop(fname, None)
+      else:
+        self._bibfiles[fname] = (stamp, parsed)
+
+  def bibentries(self, bibpaths):
+    """Returns a tuple (keys, unreadable): the keys of the entries in the
+    BibTeX databases `bibpaths', and the databases that could not be read.
+
+    Keys are listed in the order of `bibpaths', without duplicates."""
+
+    self._parse_bibfiles(bibpaths)
+
+    keys = []
+    unreadable = []
+    for fname in bibpaths:
+      cached = self._bibfiles.get(fname)
+      if cached is None:
+        unreadable.append(fname)
+      else:
+        keys += cached[1][0]
+
+    # The same key may appear in several databases: keep the first one.
+    return list(dict.fromkeys(keys)), unreadable
+
+  def bibentry_locations(self, bibpaths):
+    """Returns a dictionary mapping each key in the databases `bibpaths'
+    to a tuple (fname, lineno) where it is defined."""
+
+    self._parse_bibfiles(bibpaths)
+
+    locations = {}
+    for fname in bibpaths:
+      cached = self._bibfiles.get(fname)
+      if cached is None:
+        continue
+      keys, linenos = cached[1]
+      for key, lineno in zip(keys, linenos):
+        locations.setdefault(key, (fname, lineno))
+    return locations
+
+  def _merge(self, name, master, build):
+    """Returns build(project), for the project of `master'.
+
+    The result is kept until any file of the project is scanned again, so
+    that maps merged from the records of all the files are only rebuilt
+    when something changed."""
+
+    project = self.project(master)
+    cached = self._merged.get((name, master))
+    if cached is not None and _same_records(cached[0], project):
+      return cached[1]
+
+    result = build(project)
+    self._merged[(name, master)] = (project, result)
+    return result
+
+  def crossrefs(self, master):
+    """Returns a dictionary with the keys 'labels', 'references' and
+    'citations', mapping each label or citekey of the project of `master'
+    to the list of places (fname, lineno) where it is defined or used."""
+
+    def build(project):
+      crossrefs = {'labels': {}, 'references': {}, 'citations': {}}
+      for fname, record in project:
+        for kind in crossrefs:
+          places = crossrefs[kind]
+          for name, lineno in getattr(record, kind):
+            places.setdefault(name, []).append((fname, lineno))
+      return crossrefs
+
+    return self._merge('crossrefs', master, build)
+
+  def definitions(self, master):
+    """Returns a tuple (macros, environments) with the macros and the
+    environments defined in the project of `master'.
+
+    macros is a list of tuples (name, nargs, fname) and environments a
+    list of tuples (name, math, fname); see TeXSevenFileRecord. Later
+    definitions of the same name replace earlier ones."""
+
+    def build(project):
+      macros = {}
+      environments = {}
+      for fname, record in project:
+        for name, nargs, lineno in record.macros:
+          macros[name] = (name, nargs, fname)
+        for name, math, lineno in record.environments:
+          environments[name] = (name, math, fname)
+      return list(macros.values()), list(environments.values())
+
+    return self._merge('definitions', master, build)
+
+  def _outline(self, master):
+    """Returns a tuple (outline, trails); see outline() and locator()."""
+
+    folder = path.dirname(master)
+
+    def build(project):
+      records = dict(project)
+      outline = []
+      trails = {}
+
+      def walk(fname, trail):
+        if fname in trails or fname not in records:
+          return
+        trails[fname] = trail
+
+        record = records[fname]
+        # Headings and inclusions, merged by line number.
+        events = [ (section[-1], 0, i) for i, section in enumerate(record.sections) ]
+        events += [ (include[-1], 1, i) for i, include in enumerate(record.includes) ]
+        for lineno, kind, i in sorted(events):
+          if kind == 1:
+            walk(self.resolve(folder, record.includes[i][1]), trail + (lineno,))
+          else:
+            command, title, label, lineno = record.sections[i]
+            outline.append((section_levels[command], title, label,
+                            fname, lineno))
+
+      walk(master, ())
+      return outline, trails
+
+    return self._merge('outline', master, build)
+
+  def outline(self, master):
+    """Returns the outline of the project of `master', a list of tuples
+    (level, title, label, fname, lineno) in document order; see
+    section_levels.
+
+    The headings are kept in the record of each file, so when a file
+    changes, only that file is read again."""
+
+    return self._outline(master)[0]
+
+  def locator(self, master):
+    """Returns a function position(fname, lineno), that gives the position
+    of line `lineno' of `fname' in the document whose master file is
+    `master', or None if `fname' is not part of it.
+
+    Positions are tuples that sort in document order: the line numbers
+    of the \include's and \input's leading to `fname', then lineno. The
+    project is only looked at here, so position() itself is cheap."""
+
+    trails = self._outline(master)[1]
+
+    def position(fname, lineno):
+      trail = trails.get(fname)
+      return trail + (lineno,) if trail is not None else None
+
+    return position
+
+  def clear(self):
+    self._records.clear()
+    self._artifacts.clear()
+    self._bibfiles.clear()
+    self._merged.clear()
+
+  def _artifact(self, fname, parser):
+    """Returns `parser' applied to the contents of the build artifact
+    `fname', or None if it does not exist. Results are cached until the
+    file changes on disk."""
+
+    stamp = TeXSevenSource.stamp(self.source, fname)
+    if stamp is None:
+      self._artifacts.pop(fname, None)
+      return None
+
+    cached = self._artifacts.get(fname)
+    if cached is not None and cached[0] == stamp:
+      return cached[1]
+
+    logging.debug("TeX-7: Reading `{0}'".format(path.basename(fname)))
+    try:
+      result = parser(TeXSevenSource.read(self.source, fname))
+    except IOError:
+      return None
+
+    self._artifacts[fname] = (stamp, result)
+    return result
+
+  def _newer_than(self, fname, sources):
+    """Returns True if `fname' exists and was written after all the files
+    in `sources' were last saved."""
+
+    try:
+      mtime = os.stat(fname).st_mtime
+    except OSError:
+      return False
+
+    for source in sources:
+      saved = self.source.saved_mtime(source)
+      if saved is None or saved > mtime:
+        return False
+    return True
+
+  def _known_sources(self, master, aux_inputs):
+    """Returns the names of the source files of `master', as far as they
+    are known without scanning any of them.
+
+    If `master' was scanned already, they are those of the records in the
+    index. Otherwise they are `master', the files whose .aux files are
+    named in `aux_inputs' (the \@input chain, i.e. the \include'd files)
+    and, if LaTeX wrote a .fls file, the .tex files it lists in the
+    folder of `master'."""
+
+    folder = path.dirname(master)
+    if master in self._records:
+      fnames = []
+      pending = [master]
+      while pending:
+        fname = pending.pop(0)
+        cached = self._records.get(fname)
+        if fname in fnames or cached is None:
+          continue
+        fnames.append(fname)
+        pending += [ self.resolve(folder, name)
+                     for command, name, lineno in cached[1].includes ]
+      return fnames
+
+    fnames = [master]
+    fnames += [ path.splitext(path.join(folder, name))[0] + '.tex'
+                for name in aux_inputs ]
+    fls = self._artifact(path.splitext(master)[0] + '.fls', scan_fls)
+    if fls is not None:
+      fnames += [ fname for fname in fls if fname.endswith('.tex') and
+                  fname.startswith(path.join(folder, '')) ]
+    return fnames
+
+  def aux_labels(self, master):
+    """Returns a list of tuples (label, number, page) read from the .aux
+    files of `master'.
+
+    Returns None if there is no .aux file, or if any file of the project
+    was changed after it was written: the caller should then scan the
+    sources instead. Only the dates of the sources are looked at, see
+    _known_sources()."""
+
+    aux = path.splitext(master)[0] + '.aux'
+    folder = path.dirname(aux)
+
+    records = []
+    inputs = []
+    pending = [aux]
+    while pending:
+      fname = pending.pop(0)
+      if fname in inputs:
+        continue
+      inputs.append(fname)
+
+      record = self._artifact(fname, scan_aux)
+      if record is None:
+        continue
+      records.append(record)
+      pending += [ path.join(folder, i) for i in record.inputs ]
+
+    if not records:
+      return None
+    sources = self._known_sources(master, [ path.relpath(i, folder) for i in inputs[1:] ])
+    if not self._newer_than(aux, sources):
+      return None
+
+    labels = []
+    for record in records:
+      labels += record.labels
+    return labels
+
+  def labels(self, master):
+    """Returns a list of tuples (label, menu) for the whole project of
+    `master', or None if `master' cannot be read.
+
+    If the document was built after its files were last changed, the
+    labels are read from the .aux files and the menu shows their number
+    and page. Otherwise the sources are scanned, and the menu shows the
+    file where each label is defined."""
+
+    aux_labels = self.aux_labels(master)
+    if aux_labels is not None:
+      logging.debug('TeX-7: Found {0} labels in .aux files'.format(len(aux_labels)))
+      return [ (label, '{0} (p. {1})'.format(number, page))
+               for label, number, page in aux_labels ]
+
+    project = self.project(master)
+    if not project:
+      return None
+
+    folder = path.dirname(master)
+    labels = []
+    for fname, record in project:
+      # All labels of a file share one (interned) menu string.
+      fname = sys.intern(path.relpath(fname, folder))
+      labels += [ (label, fname) for label, lineno in record.labels ]
+
+    logging.debug('TeX-7: Found {0} labels'.format(len(labels)))
+    return labels
+
+  def bbl_entries(self, master, bibpaths):
+    """Returns the keys of all the entries in the BibTeX databases
+    `bibpaths', read from the .bbl file of `master'.
+
+    The .bbl file only lists cited entries, so this is only possible when
+    everything was cited, with \nocite{*}. Returns None otherwise, or if
+    any database changed after the .bbl file was written."""
+
+    base = path.splitext(master)[0]
+    if not self._newer_than(base + '.bbl', bibpaths):
+      return None
+
+    bcf = self._artifact(base + '.bcf', scan_bcf)
+    aux = self._artifact(base + '.aux', scan_aux)
+    if '*' not in (bcf or []) and (aux is None or '*' not in aux.citations):
+      return None
+
+    return self._artifact(base + '.bbl', scan_bbl)
+
+  @staticmethod
+  def resolve(folder, name):
+    """Returns the full path of a file named in \\include or \\input.
+
+    As in LaTeX, the name is relative to the compilation folder and the
+    extension .tex is optional."""
+
+    fname = path.normpath(path.join(folder, name))
+    if not fname.endswith('.tex') and not path.isfile(fname):
+      fname += '.tex'
+    return fname
+
+  def project(self, master):
+    """Returns a list of tuples (fname, record) for `master' and all the
+    files it \include's or \input's, recursively, in document order.
+
+    Files that cannot be read are left out."""
+
+    folder = path.dirname(master)
+
+    # Bring the records up to date one level of inclusion at a time, so
+    # that the files of each level can be scanned in parallel.
+    seen = set()
+    frontier = [master]
+    while frontier:
+      seen.update(frontier)
+      self._scan(frontier)
+
+      children = []
+      for fname in frontier:
+        cached = self._records.get(fname)
+        if cached is None:
+          continue
+        for command, name, lineno in cached[1].includes:
+          child = self.resolve(folder, name)
+          if child not in seen and child not in children:
+            children.append(child)
+      frontier = children
+
+    # Then list them in document order.
+    files = []
+    visited = set()
+
+    def walk(fname):
+      if fname in visited:
+        return
+      visited.add(fname)
+
+      cached = self._records.get(fname)
+      if cached is None:
+        logging.debug("TeX-7: Cannot read included file `{0}'".format(fname))
+        return
+
+      files.append((fname, cached[1]))
+      for command, name, lineno in cached[1].includes:
+        walk(self.resolve(folder, name))
+
+    walk(master)
+    return files
+
+  def dependencies(self, master):
+    """Returns the names of `master' and of all the files it \include's or
+    \input's, recursively, including those that cannot be read (yet)."""
+
+    folder = path.dirname(master)
+    fnames = [master]
+    for fname, record in self.project(master):
+      for command, name, lineno in record.includes:
+        child = self.resolve(folder, name)
+        if child not in fnames:
+          fnames.append(child)
+    return fnames
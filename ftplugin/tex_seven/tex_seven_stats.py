@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+# LaTeX filetype plugin
+# Languages:    Python
+# Maintainer:   Óscar Pereira
+# Version:      0.1
+# License:      GPL
+
+#************************************************************************
+#
+#                     TeX-7 library: Vim script
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#    Copyright Elias Toivanen, 2011-2014
+#    Copyright Óscar Pereira, 2020
+#
+#************************************************************************
+
+# Short summary of the module:
+#
+# Counts words, displayed equations, figures and citations in the files
+# of a LaTeX project, per section and per file. The counts are kept
+# between calls, and when a file changes only the sections whose text
+# changed are counted again, so that a status line counter stays cheap
+# even for book-length documents.
+
+import re
+import logging
+from bisect import bisect_right
+
+from tex_seven_index import strip_comments
+
+regexp_display = re.compile(r'\\begin\s*{(equation|align|gather|multline|flalign'
+                            r'|eqnarray|displaymath)(\*?)}.*?\\end\s*{\1\2}'
+                            r'|\\\[.*?\\\]|\$\$.*?\$\$', re.DOTALL)
+
+regexp_inline = re.compile(r'\$[^$]*\$|\\\(.*?\\\)'
+                           r'|\\begin\s*{math}.*?\\end\s*{math}', re.DOTALL)
+
+regexp_figure = re.compile(r'\\begin\s*{figure\*?}')
+
+regexp_citation = re.compile(r'\\[a-zA-Z]*[cC]ite[a-zA-Z]*\*?\s*'
+                             r'(?:\[[^\]]*\]\s*)*{([^}]*)}')
+
+# Commands whose arguments are not part of the text.
+regexp_nontext = re.compile(r'\\(?:begin|end|label|[a-zA-Z]*ref|[a-zA-Z]*[cC]ite[a-zA-Z]*'
+                            r'|usepackage|documentclass|include|input|includeonly'
+                            r'|includegraphics|bibliography|bibliographystyle'
+                            r'|addbibresource|graphicspath|newcommand|renewcommand'
+                            r'|providecommand|newenvironment|renewenvironment'
+                            r'|setlength|vspace|hspace)(?![a-zA-Z@])\*?\s*'
+                            r'(?:\[[^\]]*\]\s*)*(?:{[^{}]*})?')
+
+regexp_control = re.compile(r'\\(?:[a-zA-Z@]+\*?|.)')
+
+regexp_word = re.compile(r"[^\W_]+(?:['-][^\W_]+)*")
+
+class TeXSevenStats(object):
+  """Counts for a piece of a LaTeX document."""
+
+  __slots__ = ('words', 'equations', 'figures', 'citations')
+
+  def __init__(self, words=0, equations=0, figures=0, citations=0):
+    self.words = words
+    self.equations = equations
+    self.figures = figures
+    self.citations = citations
+
+  def __add__(self, other):
+    return TeXSevenStats(self.words + other.words,
+                         self.equations + other.equations,
+                         self.figures + other.figures,
+                         self.citations + other.citations)
+
+  def __str__(self):
+    return "{0} words, {1} equations, {2} figures, {3} citations".format(
+           self.words, self.equations, self.figures, self.citations)
+
+def count_text(text):
+  """Returns the TeXSevenStats of `text', which should not contain
+  comments.
+
+  Like texcount, words are only counted in the text, not in maths or in
+  the arguments of commands such as \\label or \\cite. Only displayed
+  maths count as equations."""
+
+  citations = sum(len([ k for k in arg.split(',') if k.strip() ])
+                  for arg in regexp_citation.findall(text))
+  figures = len(regexp_figure.findall(text))
+
+  text, equations = regexp_display.subn(' ', text)
+  text = regexp_inline.sub(' ', text)
+  text = regexp_nontext.sub(' ', text)
+  text = regexp_control.sub(' ', text)
+  words = len(regexp_word.findall(text))
+
+  return TeXSevenStats(words, equations, figures, citations)
+
+def split_sections(text, headings):
+  """Splits the LaTeX source `text' at its headings, found on the lines
+  `headings' (see TeXSevenFileRecord.sections).
+
+  Returns a list of tuples (lineno, text): the first piece starts at line
+  1, and every other one at the line of a heading. Comments, and the
+  preamble and anything after \\end{document} in a master file, are
+  left out."""
+
+  text = strip_comments(text)
+
+  begin = text.find('\\begin{document}')
+  if begin >= 0:
+    # Keep the line breaks, so that line numbers stay right.
+    text = '\n' * text.count('\n', 0, begin) + text[begin:]
+  end = text.find('\\end{document}')
+  if end >= 0:
+    text = text[:end]
+
+  sections = []
+  first, start = 1, 0 # Where the current section starts
+  lineno, offset = 1, 0
+  for heading in sorted(set(headings)):
+    # Find where the line of the heading starts.
+    while lineno < heading:
+      offset = text.find('\n', offset) + 1
+      if not offset:
+        break
+      lineno += 1
+    if lineno < heading:
+      break # Past the end of the document
+
+    if offset > start:
+      sections.append((first, text[start:offset]))
+      first, start = lineno, offset
+  sections.append((first, text[start:]))
+  return sections
+
+class TeXSevenStatistics(object):
+  """Keeps the counts of each file of a project, per section.
+
+  The counts of a file are kept along with its stamp (see
+  TeXSevenSource), and the file is read again only when the stamp
+  changes. Each section is then identified by a hash of its text, and
+  only new or changed sections are counted again.
+  """
+
+  def __init__(self, index):
+    self.index = index
+    self._files = {}
+
+  def file_statistics(self, fname):
+    """Returns a list of tuples (lineno, stats) for the sections of
+    `fname'; see split_sections()."""
+
+    stamp = self.index.source.stamp(fname)
+    cached = self._files.get(fname)
+    if stamp is not None and cached is not None and cached[0] == stamp:
+      return [ (lineno, stats) for lineno, key, stats in cached[1] ]
+
+    self._files.pop(fname, None)
+    if stamp is None:
+      return []
+    try:
+      text = self.index.source.read(fname)
+    except IOError as e:
+      logging.debug("TeX-7: Cannot count `{0}': {1}".format(fname, e))
+      return []
+
+    known = dict((key, stats) for lineno, key, stats in cached[1]) if cached else {}
+    sections = []
+    record = self.index.record(fname)
+    headings = [ section[-1] for section in record.sections ] if record else []
+    for lineno, section in split_sections(text, headings):
+      key = hash(section)
+      stats = known.get(key)
+      if stats is None:
+        stats = count_text(section)
+      sections.append((lineno, key, stats))
+
+    self._files[fname] = (stamp, sections)
+    return [ (lineno, stats) for lineno, key, stats in sections ]
+
+  def statistics(self, master):
+    """Returns a tuple (sections, files) with the counts of the project
+    of `master'.
+
+    sections is a list of tuples (heading, stats), where heading is None
+    for the text before the first heading, and otherwise a heading of
+    TeXSevenIndex.outline(). The counts of a heading do not include those
+    of its subsections. files is a list of tuples (fname, stats), in
+    document order."""
+
+    outline = self.index.outline(master)
+    position = self.index.locator(master)
+    positions = [ position(fname, lineno)
+                  for level, title, label, fname, lineno in outline ]
+
+    totals = [ TeXSevenStats() for i in range(len(outline) + 1) ]
+    files = []
+    for fname, record in self.index.project(master):
+      total = TeXSevenStats()
+      for lineno, stats in self.file_statistics(fname):
+        here = position(fname, lineno)
+        if here is None:
+          continue
+        i = bisect_right(positions, here)
+        totals[i] = totals[i] + stats
+        total = total + stats
+      files.append((fname, total))
+
+    sections = list(zip([None] + outline, totals))
+    return sections, files
+
+  def total(self, master):
+    """Returns the TeXSevenStats of the whole project of `master'."""
+
+    total = TeXSevenStats()
+    for fname, record in self.index.project(master):
+      for lineno, stats in self.file_statistics(fname):
+        total = total + stats
+    return total
@@ -201,3 +201,16 @@ tex_seven_maths_cache = [
     {"word":  r"zeta",                "menu":  "ζ"}
 ]
 
+# Environments of LaTeX and of the most common packages, for completion
+# after \begin and \end.
+tex_seven_environments = [
+    "abstract", "align", "align*", "alignat", "alignat*", "array",
+    "bmatrix", "Bmatrix", "cases", "center", "description", "displaymath",
+    "document", "enumerate", "equation", "equation*", "figure", "figure*",
+    "flalign", "flalign*", "flushleft", "flushright", "gather", "gather*",
+    "itemize", "list", "math", "matrix", "minipage", "multline",
+    "multline*", "pmatrix", "proof", "quotation", "quote", "split",
+    "subequations", "table", "table*", "tabular", "tabular*",
+    "thebibliography", "titlepage", "verbatim", "verse", "vmatrix",
+    "Vmatrix"
+]
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+# LaTeX filetype plugin
+# Languages:    Python
+# Maintainer:   Óscar Pereira
+# Version:      0.1
+# License:      GPL
+
+#************************************************************************
+#
+#                     TeX-7 library: Vim script
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#    Copyright Elias Toivanen, 2011-2014
+#    Copyright Óscar Pereira, 2020
+#
+#************************************************************************
+
+# Short summary of the module:
+#
+# Finds the names of the LaTeX packages and document classes installed in
+# the TeX distribution, by reading its ls-R filename databases. The names
+# are stored on disk, and read again only when an ls-R database changes.
+
+import os
+import os.path as path
+import re
+import json
+import subprocess
+import logging
+
+def expand_braces(value):
+  """Expands kpathsea brace expressions, e.g. a{b,c} gives [ab, ac]."""
+
+  match = re.search(r'{([^{}]*)}', value)
+  if not match:
+    return [value]
+
+  head, tail = value[:match.start()], value[match.end():]
+  expanded = []
+  for alternative in match.group(1).split(','):
+    expanded += expand_braces(head + alternative + tail)
+  return expanded
+
+def find_databases():
+  """Returns the paths of the ls-R databases of the TeX distribution.
+
+  * Requires the program ``kpsewhich''
+  that is shipped with the standard TeXLive distribution.
+  """
+
+  try:
+    proc = subprocess.Popen(['kpsewhich', '-var-value=TEXMFDBS'],
+                            stdout=subprocess.PIPE)
+  except OSError as e:
+    logging.debug("TeX-7: Cannot run kpsewhich: {0}".format(e))
+    return []
+  value = proc.communicate()[0].decode('utf-8').strip()
+
+  databases = []
+  for tree in expand_braces(value):
+    for d in tree.split(os.pathsep):
+      d = d.lstrip('!')
+      lsr = path.join(d, 'ls-R')
+      if d and lsr not in databases and path.isfile(lsr):
+        databases.append(lsr)
+  return databases
+
+def parse_database(fname):
+  """Returns a tuple (packages, classes) with the names of the .sty and
+  .cls files listed in the ls-R database `fname'."""
+
+  packages, classes = set(), set()
+  with open(fname, 'r', encoding='utf-8', errors='replace') as f:
+    for line in f:
+      line = line.rstrip('\n')
+      if line.endswith('.sty'):
+        packages.add(line[:-4])
+      elif line.endswith('.cls'):
+        classes.add(line[:-4])
+  return packages, classes
+
+class TeXSevenTeXMF(object):
+  """The packages and document classes of the TeX distribution.
+
+  kpsewhich is only run once, to locate the ls-R databases. The names
+  found in them are saved in `cache_file' along with the modification
+  times of the databases, and the databases are read again only when
+  one of them changes.
+  """
+
+  def __init__(self, cache_file=None, databases=None):
+    if cache_file is None:
+      cache_dir = os.environ.get('XDG_CACHE_HOME') or path.expanduser('~/.cache')
+      cache_file = path.join(cache_dir, 'tex_seven', 'texmf.json')
+    self.cache_file = cache_file
+    self._databases = databases
+    self._stamps = None
+    self._packages = []
+    self._classes = []
+
+  @property
+  def databases(self):
+    if self._databases is None:
+      self._databases = find_databases()
+    return self._databases
+
+  def _current_stamps(self):
+    stamps = {}
+    for fname in self.databases:
+      try:
+        stamps[fname] = os.stat(fname).st_mtime
+      except OSError:
+        pass
+    return stamps
+
+  def _load(self, stamps):
+    """Reads the names saved on disk, if they are still up to date."""
+    try:
+      with open(self.cache_file, 'r', encoding='utf-8') as f:
+        cache = json.load(f)
+    except (IOError, ValueError):
+      return False
+
+    if cache.get('databases') != stamps:
+      return False
+    self._packages = cache['packages']
+    self._classes = cache['classes']
+    return True
+
+  def _save(self, stamps):
+    try:
+      os.makedirs(path.dirname(self.cache_file), exist_ok=True)
+      with open(self.cache_file, 'w', encoding='utf-8') as f:
+        json.dump({'databases': stamps,
+                   'packages': self._packages,
+                   'classes': self._classes}, f)
+    except IOError as e:
+      logging.debug("TeX-7: Cannot save `{0}': {1}".format(self.cache_file, e))
+
+  def _update(self):
+    stamps = self._current_stamps()
+    if stamps == self._stamps:
+      return
+
+    if not self._load(stamps):
+      packages, classes = set(), set()
+      for fname in stamps:
+        logging.debug("TeX-7: Reading `{0}'".format(fname))
+        try:
+          p, c = parse_database(fname)
+        except IOError:
+          continue
+        packages |= p
+        classes |= c
+      self._packages = sorted(packages)
+      self._classes = sorted(classes)
+      self._save(stamps)
+
+    self._stamps = stamps
+
+  @property
+  def packages(self):
+    self._update()
+    return self._packages
+
+  @property
+  def classes(self):
+    self._update()
+    return self._classes
@@ -102,10 +102,153 @@ def get_latex_environment(vim_window):
   return {'environment': environment, 'range': (begin, end)}
 
 def is_latex_math_environment(vim_window,
-                            environments = re.compile(r"matrix|cases|math|equation|align|array")):
-  """Returns True if the cursor is currently on a maths environment."""
+                            environments = re.compile(r"matrix|cases|math|equation|align|array"),
+                            extra = ()):
+  """Returns True if the cursor is currently on a maths environment.
+
+  `extra' lists further maths environments, e.g. those defined by the
+  user with \newenvironment."""
   e = get_latex_environment(vim_window)
-  return  bool(environments.search(e['environment']))
+  return  bool(environments.search(e['environment'])) or e['environment'] in extra
+
+def find_completion_start(line, col, limit=256):
+  """Finds where omni completion starts, for a cursor at `col' in `line'.
+
+  Scans backwards from the cursor, looking only at the innermost command
+  around it, e.g. \\cite[p. 2]{foo,ba| or \\includegraphics[width=5cm]{|.
+  At most `limit' characters are examined, however long the line is.
+
+  Returns a tuple (start, keyword): the column where the completed word
+  starts and the name of the command, without the backslash. If the
+  cursor is not in the argument of a command, keyword is None; start is
+  then -1, unless the cursor is on a command name.
+
+  """
+
+  lo = max(0, col - limit)
+
+  # The word being completed ends at the cursor.
+  i = col - 1
+  while i >= lo and line[i] not in '{},\\':
+    i -= 1
+  if i < lo or line[i] == '}':
+    return -1, None
+
+  start = i + 1
+  if line[i] == '\\':
+    return start, None
+
+  # Keys may be separated by blanks as well, e.g. \\cite{foo, ba|
+  while start < col and line[start] in ' \t':
+    start += 1
+
+  # Go back over the previous keys of a list, e.g. \\cite{a,b,c
+  while line[i] != '{':
+    if line[i] in '}\\[]()':
+      return -1, None
+    i -= 1
+    if i < lo:
+      return -1, None
+
+  # Go back over the optional [...] and (...) arguments.
+  i -= 1
+  while i >= lo and line[i] in ']) \t':
+    if line[i] in ' \t':
+      i -= 1
+      continue
+
+    closing = line[i]
+    opening = '[' if closing == ']' else '('
+    depth = 0
+    while i >= lo:
+      if line[i] == closing:
+        depth += 1
+      elif line[i] == opening:
+        depth -= 1
+        if depth == 0:
+          break
+      i -= 1
+    i -= 1
+
+  # The command name, possibly starred.
+  if i >= lo and line[i] == '*':
+    i -= 1
+  end = i + 1
+  while i >= lo and line[i].isalpha():
+    i -= 1
+  if i < lo or line[i] != '\\' or i + 1 == end:
+    return -1, None
+
+  return start, line[i+1:end]
+
+def find_argument(line, col,
+                  command=re.compile(r'\\?[a-zA-Z]*\*?(?:\s*\[[^]]*\])*\s*{')):
+  """Returns a tuple (command, key) for the key under the cursor at `col'
+  in `line', e.g. ('ref', 'foo') for \\ref{f|oo}. The cursor may also be
+  on the name of the command.
+
+  Returns (None, None) if the cursor is not on a command argument."""
+
+  # On the name of the command: move into its argument.
+  match = command.match(line, col)
+  if match:
+    col = match.end()
+
+  end = col
+  while end < len(line) and line[end] not in ',}':
+    end += 1
+  start, keyword = find_completion_start(line, end)
+  key = line[start:end].strip() if start != -1 else ''
+  if keyword is None or not key:
+    return None, None
+  return keyword, key
+
+class TeXSevenCompletion(object):
+  """A completion candidate with a word and a menu text.
+
+  Candidates are kept as these small objects, rather than as
+  dictionaries, and only turned into dictionaries (see as_dict) for
+  the completions actually handed over to Vim.
+  """
+
+  __slots__ = ('word', 'menu')
+
+  def __init__(self, word, menu):
+    self.word = word
+    self.menu = menu
+
+  def as_dict(self):
+    return {'word': self.word, 'menu': self.menu}
+
+def filter_completions(candidates, base):
+  """Returns the candidates that match `base', best matches first.
+
+  Candidates may be strings or TeXSevenCompletion objects. Matching
+  ignores case; candidates starting with `base' come first, then those
+  containing it, and last those containing its characters in order
+  (fuzzy match). Within each group the original order is kept.
+
+  """
+
+  if not base:
+    return list(candidates)
+
+  base = base.lower()
+  prefix, substring, fuzzy = [], [], []
+  for c in candidates:
+    word = (c if isinstance(c, str) else c.word).lower()
+    i = word.find(base)
+    if i == 0:
+      prefix.append(c)
+    elif i > 0:
+      substring.append(c)
+    else:
+      # Subsequence test: each character must be found after the previous one.
+      chars = iter(word)
+      if all(ch in chars for ch in base):
+        fuzzy.append(c)
+
+  return prefix + substring + fuzzy
 
 class TeXSevenError(Exception):
   pass
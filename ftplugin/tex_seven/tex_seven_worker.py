@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+# LaTeX filetype plugin
+# Languages:    Python
+# Maintainer:   Óscar Pereira
+# Version:      0.1
+# License:      GPL
+
+#************************************************************************
+#
+#                     TeX-7 library: Vim script
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#    Copyright Elias Toivanen, 2011-2014
+#    Copyright Óscar Pereira, 2020
+#
+#************************************************************************
+
+# Short summary of the module:
+#
+# A standalone process that owns a TeXSevenIndex and answers queries
+# about LaTeX projects, so that slow work (kpsewhich, fc-list, parsing
+# large BibTeX databases) does not block Vim. Several Vim instances may
+# connect to the same worker and share its index.
+#
+# The worker listens on a Unix socket that only its user may connect to,
+# and speaks the protocol of Vim's JSON channels (see :help channel-use):
+# requests are [id, [method, args...]] and replies are [id, result]. It
+# exits after a period without connections.
+#
+# Usage: python3 tex_seven_worker.py SOCKET [IDLE_MINUTES]
+
+import os
+import os.path as path
+import sys
+import socket
+import json
+import socketserver
+import threading
+import logging
+
+sys.path.insert(0, path.dirname(path.abspath(__file__)))
+from tex_seven_index import TeXSevenIndex, find_bibfile, installed_fonts
+
+class TeXSevenWorker(object):
+  """The queries answered by the worker.
+
+  Files are read from disk, so unsaved changes in Vim are not seen."""
+
+  def __init__(self):
+    self.index = TeXSevenIndex()
+    self._fonts = None
+
+  def labels(self, master):
+    labels = self.index.labels(master)
+    return [ list(i) for i in labels ] if labels is not None else []
+
+  def bibentries(self, master):
+    record = self.index.record(master)
+    if record is None:
+      return []
+
+    bibpaths = []
+    for b in record.bibresources:
+      bibpath = find_bibfile(b, path.dirname(master))
+      if bibpath and bibpath not in bibpaths:
+        bibpaths.append(bibpath)
+
+    entries = self.index.bbl_entries(master, bibpaths)
+    if entries is None:
+      entries, unreadable = self.index.bibentries(bibpaths)
+    return entries
+
+  def fonts(self):
+    if self._fonts is None:
+      self._fonts = installed_fonts()
+    return self._fonts
+
+  def ping(self):
+    return 'pong'
+
+class TeXSevenHandler(socketserver.BaseRequestHandler):
+  """Serves the requests of one Vim instance."""
+
+  def handle(self):
+    server = self.server
+    server.connected(1)
+    decoder = json.JSONDecoder()
+    data = ''
+    try:
+      while True:
+        chunk = self.request.recv(65536)
+        if not chunk:
+          break
+        data += chunk.decode('utf-8')
+
+        # Vim does not delimit messages, so decode them one at a time.
+        while True:
+          data = data.lstrip()
+          if not data:
+            break
+          try:
+            message, end = decoder.raw_decode(data)
+          except ValueError:
+            break # Incomplete message
+          data = data[end:]
+          self.reply(message)
+    except OSError as e:
+      logging.debug("TeX-7: Connection closed: {0}".format(e))
+    finally:
+      server.connected(-1)
+
+  def reply(self, message):
+    try:
+      msgid, (method, *args) = message
+      if method.startswith('_') or not hasattr(TeXSevenWorker, method):
+        raise ValueError("No such method: {0}".format(method))
+      with self.server.lock:
+        result = getattr(self.server.worker, method)(*args)
+    except Exception as e:
+      # Anything else would kill the connection of this Vim instance.
+      logging.error("TeX-7: Bad request {0!r}: {1}".format(message, e))
+      if not isinstance(message, list) or not message:
+        return
+      msgid, result = message[0], None
+
+    reply = json.dumps([msgid, result]) + '\n'
+    self.request.sendall(reply.encode('utf-8'))
+
+class TeXSevenServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  """Accepts connections from Vim on the Unix socket `address', and shuts
+  down after `idle' seconds without any."""
+
+  daemon_threads = True
+
+  def __init__(self, address, idle):
+    socketserver.UnixStreamServer.__init__(self, address, TeXSevenHandler)
+    self.worker = TeXSevenWorker()
+    self.lock = threading.Lock() # Serialises access to the index
+    self.idle = idle
+    self._clients_lock = threading.Lock()
+    self._clients = 0
+    self._timer = None
+    self.connected(0)
+
+  def connected(self, delta):
+    with self._clients_lock:
+      self._clients += delta
+      if self._timer is not None:
+        self._timer.cancel()
+        self._timer = None
+      if self._clients == 0:
+        self._timer = threading.Timer(self.idle, self.shutdown)
+        self._timer.daemon = True
+        self._timer.start()
+
+def in_use(address):
+  """Tells whether a worker is listening on the Unix socket `address'."""
+
+  client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    client.connect(address)
+  except OSError:
+    return False
+  finally:
+    client.close()
+  return True
+
+def main(argv):
+  address = argv[1]
+  idle = float(argv[2]) * 60 if len(argv) > 2 else 30 * 60
+
+  if in_use(address):
+    logging.error("TeX-7: A worker is already listening on {0}".format(address))
+    return 1
+  if path.exists(address):
+    os.remove(address) # Left over by a worker that did not exit cleanly
+
+  # Other users may neither connect to the socket, nor replace it.
+  os.umask(0o077)
+  try:
+    server = TeXSevenServer(address, idle)
+  except OSError as e:
+    logging.error("TeX-7: Cannot start worker: {0}".format(e))
+    return 1
+
+  try:
+    with server:
+      server.serve_forever()
+  finally:
+    os.remove(address)
+  return 0
+
+if __name__ == '__main__':
+  logging.basicConfig(level=logging.ERROR)
+  sys.exit(main(sys.argv))